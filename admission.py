@@ -0,0 +1,135 @@
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from tracing import registry, Counter, Gauge
+import hashlib
+import asyncio
+import os
+
+admission_active = registry.register(Gauge("sparky_admission_active", "Agent runs currently admitted."))
+admission_queued = registry.register(Gauge("sparky_admission_queued", "Agent runs waiting for admission."))
+admission_rejected = registry.register(Counter("sparky_admission_rejected_total", "Agent runs rejected by admission control.", ("reason",)))
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: float = 1.0):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+def user_key(user_name: str, user_jwt: str = None) -> str:
+    # Queue by JWT when present (one real account), otherwise by the self-reported name.
+    if user_jwt: return "jwt:" + hashlib.sha256(user_jwt.encode()).hexdigest()[:16]
+    return "name:" + (user_name or "")
+
+class AdmissionController:
+    """
+    Global concurrency limit for agent runs with a bounded wait queue.
+    Waiting runs are queued per user and admitted round-robin across users, so one user sending
+    many requests cannot starve the others. When the queue (or a user's share of it) is full,
+    acquire() raises AdmissionRejected right away instead of letting requests pile up.
+    """
+    def __init__(self, max_concurrent: int = 32, max_queue: int = 128, max_queue_per_user: int = 16, queue_timeout: float = 30.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.queued = 0
+        self.waiters = OrderedDict()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_concurrent=int(os.getenv("ADMISSION_MAX_CONCURRENT", 32)),
+            max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", 128)),
+            max_queue_per_user=int(os.getenv("ADMISSION_MAX_QUEUE_PER_USER", 16)),
+            queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 30)),
+        )
+
+    def _update_gauges(self):
+        admission_active.set(self.active)
+        admission_queued.set(self.queued)
+
+    async def acquire(self, key: str):
+        if self.active < self.max_concurrent and not self.queued:
+            self.active += 1
+            self._update_gauges()
+            return
+        if self.queued >= self.max_queue:
+            admission_rejected.inc(reason="queue_full")
+            raise AdmissionRejected("queue_full")
+        user_waiters = self.waiters.get(key)
+        if user_waiters is not None and len(user_waiters) >= self.max_queue_per_user:
+            admission_rejected.inc(reason="user_queue_full")
+            raise AdmissionRejected("user_queue_full")
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(key, deque()).append(future)
+        self.queued += 1
+        self._update_gauges()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as we gave up, pass it on.
+                self.release()
+            else:
+                future.cancel()
+                self._remove_waiter(key, future)
+            if isinstance(e, asyncio.TimeoutError):
+                admission_rejected.inc(reason="queue_timeout")
+                raise AdmissionRejected("queue_timeout")
+            raise
+
+    def _remove_waiter(self, key: str, future):
+        user_waiters = self.waiters.get(key)
+        if user_waiters is None or future not in user_waiters: return
+        user_waiters.remove(future)
+        self.queued -= 1
+        if not user_waiters: del self.waiters[key]
+        self._update_gauges()
+
+    def release(self):
+        # Hand the slot straight to the next user in rotation, keeping `active` unchanged.
+        while self.waiters:
+            key, user_waiters = self.waiters.popitem(last=False)
+            future = user_waiters.popleft()
+            self.queued -= 1
+            if user_waiters: self.waiters[key] = user_waiters
+            if not future.done():
+                future.set_result(None)
+                self._update_gauges()
+                return
+        self.active -= 1
+        self._update_gauges()
+
+    def releaser(self):
+        """
+        Return a callable that releases one acquired slot the first time it is called and does
+        nothing afterwards, for slots whose release can be reached from several places.
+        """
+        released = False
+        def release_once():
+            nonlocal released
+            if released: return
+            released = True
+            self.release()
+        return release_once
+
+    @asynccontextmanager
+    async def slot(self, key: str):
+        await self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            "waiting_users": len(self.waiters),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+        }
+
+admission = AdmissionController.from_env()
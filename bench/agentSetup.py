@@ -0,0 +1,39 @@
+"""
+Microbenchmark of per-request agent setup: building the agent graph per request (previous behaviour)
+against looking up the prebuilt registry in wrapper.MAIN_AGENTS.
+
+    uv run python -m bench.agentSetup --iterations 2000
+"""
+import argparse
+import timeit
+import cartAgent
+import ragAgent
+import wrapper
+
+def build_per_request(use_structuring):
+    # What every request paid before: a fresh Cart Manager, main agent and RAG agent.
+    cart_manager = cartAgent.get_user_agent()
+    agent = wrapper.build_main_agent(use_structuring).clone(handoffs=[cart_manager])
+    rag_agent = ragAgent.rag_agent.clone()
+    return agent, rag_agent
+
+def prebuilt(use_structuring):
+    return wrapper.get_main_agent(use_structuring), ragAgent.rag_agent
+
+def report(name, fn, iterations):
+    seconds = min(timeit.repeat(lambda: fn(True), number=iterations, repeat=5))
+    per_call = seconds / iterations * 1e6
+    print(f"{name:<20} {per_call:10.2f} us/request")
+    return per_call
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    before = report("per-request build", build_per_request, args.iterations)
+    after = report("prebuilt registry", prebuilt, args.iterations)
+    print(f"{'saved':<20} {before - after:10.2f} us/request ({before / max(after, 1e-9):.0f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Report how many prompt tokens the product cards save per tool, compared with full embedding_text.
+
+Samples tool-sized pages of products (from Spark.products, or a synthetic catalog with --synthetic)
+and formats them the way each tool does, with and without details. Token counts use tiktoken when
+installed, otherwise an estimate of 4 characters per token.
+
+    uv run python -m bench.cardTokens --samples 50
+    uv run python -m bench.cardTokens --synthetic 2000
+"""
+import argparse
+import random
+import statistics
+
+try:
+    import tiktoken
+    encoding = tiktoken.get_encoding("o200k_base")
+    def count_tokens(text: str) -> int: return len(encoding.encode(text))
+except ImportError:
+    def count_tokens(text: str) -> int: return len(text) // 4
+
+# Tool name -> products per call, matching the tool defaults.
+TOOL_PAGES = {
+    "search_by_category": 15,
+    "fuzzy_search": 15,
+    "search_by_ids": 10,
+    "retrieve_products": 8,
+}
+
+def load_products(synthetic: int = None) -> list:
+    if synthetic:
+        from bench.stubs import Catalog
+        return Catalog(synthetic, dimensions=8).products
+    import utils
+    return list(utils.get_products_collection().find({}, {"embedding_text": 1, "name": 1, "brand": 1, "category": 1, "price": 1, "rating": 1}))
+
+def format_tool(tool: str, products: list, details: bool) -> str:
+    import searchTools
+    import utils
+    if tool == "retrieve_products":
+        results = [{**product, "score": 0.9} for product in products]
+        return utils.format_retrieved_products(results, details)
+    return searchTools.format_products(products, details)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=50, help="tool calls sampled per tool")
+    parser.add_argument("--synthetic", type=int, help="use a synthetic catalog of this size instead of Mongo")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    products = load_products(args.synthetic)
+    rng = random.Random(args.seed)
+    print(f"{len(products)} products, {args.samples} sampled calls per tool, tokens per call:")
+    print(f"{'tool':<26} {'full':>8} {'cards':>8} {'saved':>7}")
+    totals = [0, 0]
+    for tool, page in TOOL_PAGES.items():
+        full, cards = [], []
+        for _ in range(args.samples):
+            sample = rng.sample(products, min(page, len(products)))
+            full.append(count_tokens(format_tool(tool, sample, True)))
+            cards.append(count_tokens(format_tool(tool, sample, False)))
+        totals[0] += sum(full)
+        totals[1] += sum(cards)
+        print(f"{tool:<26} {statistics.mean(full):>8.0f} {statistics.mean(cards):>8.0f} {1 - sum(cards) / sum(full):>7.1%}")
+    print(f"{'all tools':<26} {totals[0] / args.samples / len(TOOL_PAGES):>8.0f} {totals[1] / args.samples / len(TOOL_PAGES):>8.0f} {1 - totals[1] / totals[0]:>7.1%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Recall vs latency of embedding profiles (reduced dimensions, int8/binary quantization with float
+rescoring) against the current setup: exact search over the full vectors.
+
+Every profile is built into a local exact index from the stored full vectors; recall@k is measured
+against exact full-dimension results for the same queries. With --mongo, each profile's Atlas index
+(see `python -m embeddingProfile`) is queried as well. --synthetic runs on the stub catalog, whose
+hashed vectors do not shorten the way text-embedding-3 vectors do, so only use it to try the script.
+
+    uv run python -m bench.embeddingProfiles --dimensions 3072 1024 512 256 --quantization none int8 binary
+    uv run python -m bench.embeddingProfiles --query-file queries.txt --mongo
+    uv run python -m bench.embeddingProfiles --synthetic 20000 --source-dimensions 512
+"""
+import argparse
+import statistics
+import numpy as np
+from bench.vectorSearch import percentile, timed
+from embeddingProfile import EmbeddingProfile
+from vectorIndex import VectorIndex
+
+def load_catalog(synthetic: int = None, source_dimensions: int = None):
+    if synthetic:
+        from bench.stubs import Catalog
+        catalog = Catalog(synthetic, dimensions=source_dimensions or 3072)
+        return [product["_id"] for product in catalog.products], catalog.matrix.astype(np.float32)
+    import utils
+    ids, rows = [], []
+    for product in utils.get_products_collection().find({"embedding": {"$exists": True}}, {"_id": 1, "embedding": 1}, batch_size=1000):
+        ids.append(product["_id"])
+        rows.append(np.asarray(product["embedding"], dtype=np.float32))
+    return ids, np.stack(rows)
+
+def index_bytes(index: VectorIndex) -> int:
+    return index.matrix.nbytes + (0 if index.codes is None else index.codes.nbytes) + (0 if index.scales is None else index.scales.nbytes)
+
+def atlas_bytes_per_vector(profile: EmbeddingProfile, dimensions: int) -> float:
+    # Size of the vectors the Atlas ANN index keeps in memory.
+    return {"none": dimensions * 4, "int8": dimensions, "binary": dimensions / 8}[profile.quantization]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dimensions", type=int, nargs="+", default=[3072, 1024, 512, 256])
+    parser.add_argument("--quantization", nargs="+", default=["none", "int8", "binary"], choices=["none", "int8", "binary"])
+    parser.add_argument("--rescore", type=int, default=4, help="candidates per result rescored with float vectors")
+    parser.add_argument("--queries", type=int, default=200, help="number of sampled product embeddings to use as queries")
+    parser.add_argument("--query-file", help="text file with one query per line, embedded with get_embedding")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--mongo", action="store_true", help="also query each profile's Atlas vector index")
+    parser.add_argument("--synthetic", type=int, help="use a synthetic catalog of this size instead of Mongo")
+    parser.add_argument("--source-dimensions", type=int, help="vector size of the synthetic catalog (default 3072)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    ids, vectors = load_catalog(args.synthetic, args.source_dimensions)
+    full_dimensions = vectors.shape[1]
+    print(f"{len(ids)} products with {full_dimensions}-dimension vectors, k={args.k}, rescore={args.rescore}")
+
+    if args.query_file:
+        import utils
+        with open(args.query_file) as f:
+            queries = [np.asarray(utils.get_embedding(line.strip()), dtype=np.float32) for line in f if line.strip()]
+    else:
+        rng = np.random.default_rng(args.seed)
+        queries = list(vectors[rng.choice(len(ids), min(args.queries, len(ids)), replace=False)])
+
+    baseline = VectorIndex(exact_threshold=len(ids) + 1)
+    baseline.build(ids, vectors, [""] * len(ids))
+    truth = [{result[0] for result in baseline.search(query, args.k, exact=True)} for query in queries]
+
+    print(f"{'profile':<22} {'build ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'recall@k':>9} {'local MB':>9} {'atlas B/vec':>12}" + (f" {'mongo p50':>10} {'mongo recall':>13}" if args.mongo else ""))
+    for dimensions in sorted({min(d, full_dimensions) for d in args.dimensions}, reverse=True):
+        for quantization in args.quantization:
+            profile = EmbeddingProfile(dimensions=None if dimensions == full_dimensions else dimensions, quantization=quantization, rescore=args.rescore)
+            index = VectorIndex(exact_threshold=len(ids) + 1, profile=profile)
+            _, build_ms = timed(index.build, ids, vectors, [""] * len(ids))
+            latencies, recalls = [], []
+            for query, expected in zip(queries, truth):
+                results, ms = timed(index.search, query, args.k, exact=True)
+                latencies.append(ms)
+                recalls.append(len(expected & {result[0] for result in results}) / max(len(expected), 1))
+            line = f"{f'{dimensions}d {quantization}':<22} {build_ms:>9.0f} {percentile(latencies, 50):>8.2f} {percentile(latencies, 95):>8.2f} {statistics.mean(recalls):>9.3f} {index_bytes(index) / 2**20:>9.1f} {atlas_bytes_per_vector(profile, dimensions):>12.0f}"
+            if args.mongo: line += " " + mongo_report(profile, queries, truth, args.k)
+            print(line)
+
+def mongo_report(profile: EmbeddingProfile, queries: list, truth: list, k: int) -> str:
+    import utils
+    latencies, recalls = [], []
+    try:
+        for query, expected in zip(queries, truth):
+            results, ms = timed(utils.mongo_vector_search, query.tolist(), k, profile=profile)
+            latencies.append(ms)
+            recalls.append(len(expected & {result["_id"] for result in results}) / max(len(expected), 1))
+    except Exception as e:
+        return f"{'n/a':>10} {type(e).__name__:>13}"
+    return f"{percentile(latencies, 50):>10.2f} {statistics.mean(recalls):>13.3f}"
+
+if __name__ == "__main__":
+    main()
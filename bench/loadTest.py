@@ -0,0 +1,145 @@
+"""
+Offline load test of the FastAPI app in main.py.
+
+Starts local stubs for the OpenAI Responses/Embeddings APIs and the Node backend, swaps the Mongo
+products collection for an in-memory fake, then replays JSONL traffic (one UserQuery per line)
+against /agent_response at increasing concurrency. Reports throughput, p50/p95/p99 latency and the
+mean per-request time spent in each stage (from the Server-Timing debug header). Needs no network.
+
+    uv run python -m bench.loadTest --concurrency 1 4 16 64 --requests 200
+    uv run python -m bench.loadTest --llm-latency 0.8 --json bench_output.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def serve(app, port: int):
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started: time.sleep(0.05)
+    return server
+
+def parse_server_timing(header: str) -> dict:
+    stages = {}
+    for part in filter(None, (part.strip() for part in (header or "").split(","))):
+        fields = part.split(";")
+        for field in fields[1:]:
+            if field.startswith("dur="): stages[fields[0]] = float(field[4:])
+    return stages
+
+async def run_level(client, url: str, queries: list, concurrency: int, total: int) -> dict:
+    latencies, errors, stages = [], 0, {}
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            query = queries[i % len(queries)]
+            start = time.perf_counter()
+            try:
+                response = await client.post(url, json=query, headers={"X-Debug-Timing": "1"})
+                ok = response.status_code == 200
+            except Exception:
+                ok, response = False, None
+            latencies.append((time.perf_counter() - start) * 1000)
+            if not ok: errors += 1
+            if response is not None:
+                for stage, ms in parse_server_timing(response.headers.get("Server-Timing")).items():
+                    stages.setdefault(stage, []).append(ms)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "throughput_rps": total / elapsed,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "stages_ms": {stage: sum(values) / total for stage, values in sorted(stages.items())},
+    }
+
+def print_report(results: list):
+    print(f"{'conc':>5} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}  mean stage ms/request")
+    for result in results:
+        stages = " ".join(f"{stage}={ms:.1f}" for stage, ms in result["stages_ms"].items())
+        print(f"{result['concurrency']:>5} {result['throughput_rps']:>8.1f} {result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} {result['p99_ms']:>9.1f} {result['errors']:>7}  {stages}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--traffic", default=os.path.join(os.path.dirname(__file__), "traffic.jsonl"), help="JSONL file with one UserQuery per line")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=100, help="requests per concurrency level")
+    parser.add_argument("--catalog-size", type=int, default=2000)
+    parser.add_argument("--dimensions", type=int, default=3072)
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="mean seconds per Responses API call")
+    parser.add_argument("--embedding-latency", type=float, default=0.1)
+    parser.add_argument("--node-latency", type=float, default=0.03)
+    parser.add_argument("--mongo-latency", type=float, default=0.05)
+    parser.add_argument("--vector-backend", choices=["mongo", "local"], default="mongo")
+    parser.add_argument("--endpoint", default="/agent_response")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    with open(args.traffic) as f:
+        queries = [json.loads(line) for line in f if line.strip()]
+
+    openai_port, node_port, app_port = free_port(), free_port(), free_port()
+    os.environ.update({
+        "OPENAI_API_KEY": "stub",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{openai_port}/v1",
+        "NODE_BASE_URI": f"http://127.0.0.1:{node_port}",
+        "VECTOR_SEARCH_BACKEND": args.vector_backend,
+        "LOG_PATH": os.path.join(tempfile.mkdtemp(), "loadtest.logs"),
+    })
+    os.environ.setdefault("SEMANTIC_CACHE_ENABLED", "0")
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from bench import stubs
+    print(f"Building synthetic catalog of {args.catalog_size} products...")
+    catalog = stubs.Catalog(args.catalog_size, args.dimensions)
+    serve(stubs.create_openai_stub(catalog, stubs.Latency(args.llm_latency), stubs.Latency(args.embedding_latency)), openai_port)
+    serve(stubs.create_node_stub(catalog, stubs.Latency(args.node_latency)), node_port)
+
+    from agents import set_trace_processors
+    import tracing
+    import utils
+    collection = stubs.FakeProductsCollection(catalog, stubs.Latency(args.mongo_latency))
+    utils.get_products_collection = lambda: collection
+    # Keep SDK spans feeding the local metrics without exporting traces to OpenAI.
+    set_trace_processors([tracing.metrics_processor])
+    import main as app_main
+    serve(app_main.app, app_port)
+
+    import httpx
+    async def run_all():
+        limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{app_port}", timeout=120, limits=limits) as client:
+            results = []
+            for concurrency in args.concurrency:
+                results.append(await run_level(client, args.endpoint, queries, concurrency, args.requests))
+            return results
+
+    results = asyncio.run(run_all())
+    print_report(results)
+    if args.json:
+        with open(args.json, "w") as f: json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+Local stand-ins for the services the backend talks to, used by bench.loadTest:
+
+- OpenAI Responses and Embeddings APIs with configurable latency and scripted tool calls
+- the Node backend /app/search/* and /app/cart/* endpoints over a synthetic catalog
+- a fake products collection implementing the find/find($in)/aggregate($vectorSearch) calls the app makes
+"""
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+import numpy as np
+import hashlib
+import asyncio
+import random
+import json
+import time
+import re
+
+CATEGORIES = ['Beauty', 'Home', 'Clothing', 'Sports & Outdoors', 'Food', 'Jewelry', 'Personal Care', 'Pets', 'Baby', 'Electronics', 'Toys', 'Auto & Tires']
+ADJECTIVES = ['cheap', 'premium', 'red', 'blue', 'organic', 'wireless', 'compact', 'large', 'kids', 'running', 'waterproof', 'classic']
+NOUNS = ['shoes', 'laptop', 'shirt', 'lamp', 'formula', 'headphones', 'blender', 'backpack', 'watch', 'jacket', 'toy car', 'dog food']
+
+def stub_vector(text: str, dimensions: int = 3072) -> np.ndarray:
+    # Bag-of-words hashing so that similar texts get similar vectors, like a real embedding model would.
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for word in re.findall(r"\w+", text.lower()):
+        seed = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+        vector += np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+class Latency:
+    """
+    Simulated service latency: mean seconds with uniform +/- jitter fraction.
+    """
+    def __init__(self, mean: float = 0.0, jitter: float = 0.3):
+        self.mean = mean
+        self.jitter = jitter
+
+    async def wait(self):
+        if self.mean > 0: await asyncio.sleep(self.mean * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def block(self):
+        if self.mean > 0: time.sleep(self.mean * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+class Catalog:
+    def __init__(self, size: int = 2000, dimensions: int = 3072, seed: int = 0):
+        rng = random.Random(seed)
+        self.products = []
+        for product_id in range(1, size + 1):
+            category = rng.choice(CATEGORIES)
+            name = f"{rng.choice(ADJECTIVES).title()} {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}"
+            text = f"Product ID: {product_id}, Name: {name}, Category: {category}, Price: ${rng.uniform(2, 500):.2f}, Rating: {rng.uniform(1, 5):.1f}"
+            self.products.append({"_id": product_id, "name": name, "category": category, "embedding_text": text})
+        self.by_id = {product["_id"]: product for product in self.products}
+        self.matrix = np.stack([stub_vector(product["embedding_text"], dimensions) for product in self.products])
+
+class FakeProductsCollection:
+    """
+    Stands in for Spark.products: find() for loading the local index, aggregate() for $vectorSearch.
+    """
+    def __init__(self, catalog: Catalog, latency: Latency = None):
+        self.catalog = catalog
+        self.latency = latency or Latency()
+
+    def find(self, query=None, projection=None, batch_size=None):
+        ids = ((query or {}).get("_id") or {}).get("$in")
+        if ids is not None:
+            self.latency.block()
+            return iter([dict(self.catalog.by_id[product_id]) for product_id in ids if product_id in self.catalog.by_id])
+        return ({**product, "embedding": vector.tolist()} for product, vector in zip(self.catalog.products, self.catalog.matrix))
+
+    def aggregate(self, pipeline):
+        self.latency.block()
+        search = pipeline[0]["$vectorSearch"]
+        query = np.asarray(search["queryVector"], dtype=np.float32)
+        if len(query) != self.catalog.matrix.shape[1]: query = np.resize(query, self.catalog.matrix.shape[1])
+        scores = self.catalog.matrix @ (query / (np.linalg.norm(query) or 1.0))
+        best = np.argsort(-scores)[:search["limit"]]
+        return iter([{"_id": self.catalog.products[i]["_id"], "embedding_text": self.catalog.products[i]["embedding_text"], "score": float((1 + scores[i]) / 2)} for i in best])
+
+# Tools tried in order; the first one offered in the request is called. Handoffs come first so
+# cart requests reach the Cart Manager, retrieval tools before keyword search for open-ended asks.
+DEFAULT_SCRIPT = [
+    {"match": r"\bcart\b", "tool": "transfer_to_cart_manager", "arguments": {}},
+    {"match": r"\bcart\b", "tool": "get_all_items_in_cart", "arguments": {}},
+    {"match": r"\b(recommend|suggest|similar|gift|ideas?)\b", "tool": "vector_store_retriever_agent", "arguments": {"query": "{input}"}},
+    {"match": r"\b(recommend|suggest|similar|gift|ideas?)\b", "tool": "direct_product_retriever", "arguments": {"query": "{input}", "limit": 5}},
+    {"match": r"", "tool": "hybrid_search", "arguments": {"query": "{input}", "k": 5}},
+    {"match": r"", "tool": "retrieve_products", "arguments": {"query": "{input}", "limit": 5}},
+    {"match": r"\bcategory\b", "tool": "search_by_category", "arguments": {"category": "Electronics", "limit": 5}},
+    {"match": r"", "tool": "fuzzy_search", "arguments": {"query": "{input}", "limit": 5}},
+]
+
+def input_items(body: dict) -> list:
+    items = body.get("input")
+    if isinstance(items, str): return [{"role": "user", "content": items}]
+    return items or []
+
+def user_text(items: list) -> str:
+    for item in reversed(items):
+        if item.get("role") == "user":
+            content = item.get("content")
+            if isinstance(content, str): return content
+            return " ".join(part.get("text", "") for part in content or [] if isinstance(part, dict))
+    return ""
+
+def response_body(model: str, output: list, input_tokens: int, output_tokens: int) -> dict:
+    return {
+        "id": f"resp_{random.getrandbits(64):016x}",
+        "object": "response",
+        "created_at": time.time(),
+        "model": model,
+        "status": "completed",
+        "output": output,
+        "parallel_tool_calls": True,
+        "tool_choice": "auto",
+        "tools": [],
+        "temperature": 1.0,
+        "top_p": 1.0,
+        "text": {"format": {"type": "text"}},
+        "truncation": "disabled",
+        "error": None,
+        "incomplete_details": None,
+        "instructions": None,
+        "metadata": {},
+        "usage": {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+            "input_tokens_details": {"cached_tokens": 0},
+            "output_tokens_details": {"reasoning_tokens": 0},
+        },
+    }
+
+def create_openai_stub(catalog: Catalog, llm_latency: Latency, embedding_latency: Latency, script: list = None) -> FastAPI:
+    app = FastAPI()
+    script = script or DEFAULT_SCRIPT
+
+    @app.post("/v1/responses")
+    async def responses(request: Request):
+        body = await request.json()
+        await llm_latency.wait()
+        items = input_items(body)
+        text = user_text(items)
+        input_tokens = len(json.dumps(body)) // 4
+        offered = {tool.get("name") for tool in body.get("tools", [])}
+
+        calls = {item.get("call_id"): item.get("name") for item in items if item.get("type") == "function_call"}
+        answered = [item for item in items if item.get("type") == "function_call_output" and not str(calls.get(item.get("call_id"), "")).startswith("transfer_to_")]
+        if not answered and offered:
+            for step in script:
+                if step["tool"] in offered and re.search(step["match"], text, re.IGNORECASE):
+                    arguments = {key: value.replace("{input}", text) if isinstance(value, str) else value for key, value in step["arguments"].items()}
+                    call = {"type": "function_call", "id": f"fc_{random.getrandbits(48):012x}", "call_id": f"call_{random.getrandbits(48):012x}", "name": step["tool"], "arguments": json.dumps(arguments), "status": "completed"}
+                    return response_body(body.get("model", "stub"), [call], input_tokens, 20)
+
+        tool_text = " ".join(str(item.get("output", "")) for item in answered)
+        product_ids = list(dict.fromkeys(re.findall(r"ID: (\d+)", tool_text)))[:5] or [str(random.choice(catalog.products)["_id"])]
+        answer = "Here are some products you might like:\n" + "\n".join(f"- **{catalog.by_id[int(pid)]['name'] if int(pid) in catalog.by_id else 'Product'}** (ID: {pid})" for pid in product_ids)
+        message = {"type": "message", "id": f"msg_{random.getrandbits(48):012x}", "role": "assistant", "status": "completed", "content": [{"type": "output_text", "text": answer, "annotations": []}]}
+        return response_body(body.get("model", "stub"), [message], input_tokens, len(answer) // 4)
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        await embedding_latency.wait()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        dimensions = body.get("dimensions") or catalog.matrix.shape[1]
+        data = [{"object": "embedding", "index": i, "embedding": stub_vector(text, dimensions).tolist()} for i, text in enumerate(inputs)]
+        tokens = sum(len(text.split()) for text in inputs)
+        return {"object": "list", "data": data, "model": body.get("model"), "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    return app
+
+def create_node_stub(catalog: Catalog, latency: Latency) -> FastAPI:
+    app = FastAPI()
+    carts = {}
+
+    def page(products, limit):
+        return {"products": products[:int(limit)]}
+
+    def cart_of(request: Request):
+        return carts.setdefault(request.headers.get("Authorization", ""), {})
+
+    @app.get("/app/search/category/{category}")
+    async def by_category(category: str, limit: int = 15):
+        await latency.wait()
+        products = [product for product in catalog.products if product["category"] == category]
+        if not products: return JSONResponse({"products": []}, status_code=404)
+        return page(products, limit)
+
+    @app.get("/app/search/id/{product_id}")
+    async def by_id(product_id: int):
+        await latency.wait()
+        product = catalog.by_id.get(product_id)
+        if product is None: return JSONResponse({"message": "not found"}, status_code=404)
+        return {"product": product}
+
+    @app.get("/app/search/fuzzy")
+    async def fuzzy(q: str = "", limit: int = 15):
+        await latency.wait()
+        words = set(re.findall(r"\w+", q.lower()))
+        products = [product for product in catalog.products if words & set(re.findall(r"\w+", product["embedding_text"].lower()))]
+        if not products: return JSONResponse({"products": []}, status_code=404)
+        return page(products, limit)
+
+    @app.get("/app/cart")
+    async def get_cart(request: Request):
+        await latency.wait()
+        cart = cart_of(request)
+        return {"success": True, "data": {"products": [{**catalog.by_id[product_id], **item} for product_id, item in cart.items()]}}
+
+    @app.post("/app/cart/add")
+    async def add(request: Request):
+        await latency.wait()
+        body = await request.json()
+        if body.get("productId") not in catalog.by_id: return {"success": False, "message": "Product not found"}
+        cart_of(request)[body["productId"]] = {"quantity": body.get("quantity", 1), "color": body.get("color"), "size": body.get("size")}
+        return {"success": True}
+
+    @app.delete("/app/cart")
+    async def remove(request: Request):
+        await latency.wait()
+        body = await request.json()
+        cart_of(request).pop(body.get("productId"), None)
+        return {"success": True}
+
+    @app.delete("/app/cart/clearCart")
+    async def clear(request: Request):
+        await latency.wait()
+        cart_of(request).clear()
+        return {"success": True}
+
+    return app
@@ -0,0 +1,73 @@
+"""
+Compare the local vector index against Mongo exact $vectorSearch.
+
+Queries are either sampled product embeddings (default) or embedded from a text file with one query per line.
+Recall@k is measured against the Mongo exact results.
+
+    uv run python -m bench.vectorSearch --queries 200 --k 10 --nprobe 4 8 16 32
+    uv run python -m bench.vectorSearch --query-file queries.txt
+"""
+import argparse
+import statistics
+import time
+import numpy as np
+import utils
+from vectorIndex import VectorIndex
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+def report(name, latencies, recalls=None):
+    line = f"{name:<24} mean {statistics.mean(latencies):8.2f} ms  p50 {percentile(latencies, 50):8.2f} ms  p95 {percentile(latencies, 95):8.2f} ms"
+    if recalls is not None: line += f"  recall@k {statistics.mean(recalls):.3f}"
+    print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=100, help="number of sampled product embeddings to use as queries")
+    parser.add_argument("--query-file", help="text file with one query per line, embedded with get_embedding")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument("--exact-threshold", type=int, default=20000, help="catalog size above which the IVF index is built")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    collection = utils.get_products_collection()
+    index = VectorIndex(exact_threshold=args.exact_threshold)
+    _, load_ms = timed(index.load, collection)
+    print(f"Loaded {len(index)} products in {load_ms:.0f} ms: {index.stats()}")
+
+    if args.query_file:
+        with open(args.query_file) as f:
+            queries = [utils.get_embedding(line.strip()) for line in f if line.strip()]
+    else:
+        rng = np.random.default_rng(args.seed)
+        rows = rng.choice(len(index.ids), min(args.queries, len(index.ids)), replace=False)
+        queries = [index.matrix[row].tolist() for row in rows]
+
+    truth, mongo_ms = [], []
+    for query in queries:
+        results, ms = timed(utils.mongo_vector_search, query, args.k)
+        truth.append({result["_id"] for result in results})
+        mongo_ms.append(ms)
+    report("mongo exact", mongo_ms)
+
+    def run(name, **kwargs):
+        latencies, recalls = [], []
+        for query, expected in zip(queries, truth):
+            results, ms = timed(index.search, query, args.k, **kwargs)
+            latencies.append(ms)
+            recalls.append(len(expected & {result[0] for result in results}) / max(len(expected), 1))
+        report(name, latencies, recalls)
+
+    run("local exact", exact=True)
+    if index.centroids is not None:
+        for nprobe in args.nprobe: run(f"local ivf nprobe={nprobe}", nprobe=nprobe)
+
+if __name__ == "__main__":
+    main()
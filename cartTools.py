@@ -1,12 +1,78 @@
-from utils import get_node_base_uri, User
+from utils import User, record_product_ids
 from agents import function_tool, RunContextWrapper
-import requests
-import json
+from httpClient import node_request, auth_headers
+from nodeResilience import node_tool_error
+from productCache import ProductCache
+from sharedState import shared_state
+from typing import Optional
+import pydantic
+import hashlib
+import asyncio
+import os
 
-node_base_url = get_node_base_uri()
+# Cart snapshots per JWT, so repeated cart reads within a conversation skip the backend.
+# Every mutation below invalidates the snapshot (or replaces it when the result is known).
+cart_cache = ProductCache(
+    max_bytes=int(os.getenv("CART_CACHE_MAX_BYTES", 8 * 1024 * 1024)),
+    default_ttl=float(os.getenv("CART_CACHE_TTL", 30)),
+    shared=shared_state,
+    namespace="carts",
+)
 
-@function_tool
-def add_item_to_cart(context: RunContextWrapper[User],quantity: int, product_id: int,color: str=None,size: str=None) -> str :
+class CartItem(pydantic.BaseModel):
+    product_id: int
+    quantity: int = 1
+    color: Optional[str] = None
+    size: Optional[str] = None
+
+def cart_key(jwt_token: str) -> str:
+    return hashlib.sha256(jwt_token.encode()).hexdigest()
+
+async def fetch_cart(jwt_token: str):
+    """
+    Return (status_code, response_data) for the user's cart, served from cart_cache when fresh.
+    """
+    async def fetch():
+        response = await node_request("GET", "/app/cart", headers=auth_headers(jwt_token))
+        return response.status_code, response.json() if response.status_code == 200 else None
+
+    return await cart_cache.get_or_fetch("cart", cart_key(jwt_token), fetch, cacheable=lambda result: result[0] == 200 and result[1].get('success', False))
+
+async def send_cart_item(jwt_token: str, method: str, path: str, product_id: int, quantity: int = None, color: str = None, size: str = None):
+    """
+    Add (POST /app/cart/add) or remove (DELETE /app/cart) one item.
+    Returns (status_code, success, reason).
+    """
+    payload = {"productId": product_id}
+    if quantity is not None: payload["quantity"] = quantity
+    if color: payload["color"] = color
+    if size: payload["size"] = size
+
+    try:
+        response = await node_request(method, path, headers=auth_headers(jwt_token), json=payload)
+    finally:
+        # Invalidate even on errors, the backend may have applied the change anyway.
+        cart_cache.invalidate("cart", cart_key(jwt_token))
+    if response.status_code != 200:
+        return response.status_code, False, None
+    response_data = response.json()
+    return response.status_code, response_data.get('success', False), response_data.get('message', 'No reason provided')
+
+async def send_cart_items(jwt_token: str, method: str, path: str, items: list[CartItem]) -> list:
+    semaphore = asyncio.Semaphore(int(os.getenv("CART_BULK_CONCURRENCY", 5)))
+
+    async def send(item: CartItem):
+        async with semaphore:
+            quantity = item.quantity if method == "POST" else None
+            try:
+                return await send_cart_item(jwt_token, method, path, item.product_id, quantity, item.color, item.size)
+            except Exception as e:
+                return None, False, str(e) or type(e).__name__
+
+    return await asyncio.gather(*(send(item) for item in items))
+
+@function_tool(failure_error_function=node_tool_error)
+async def add_item_to_cart(context: RunContextWrapper[User],quantity: int, product_id: int,color: str=None,size: str=None) -> str :
     """
     Add an item to the user's cart in the Walmart application.
     Args:
@@ -20,34 +86,20 @@ def add_item_to_cart(context: RunContextWrapper[User],quantity: int, product_id:
     jwt_token = context.context.user_jwt
     if not jwt_token:
         return "No user JWT token was provided."
-    url = node_base_url + f"/app/cart/add"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {jwt_token}"
-    }
-    
-    payload = {
-        "quantity":quantity,
-        "productId":product_id,
-    }
-    if color: payload["color"]=color
-    if size: payload["size"]=size
 
-    response = requests.post(url, headers=headers, json=payload)
+    status_code, success, reason = await send_cart_item(jwt_token, "POST", "/app/cart/add", product_id, quantity, color, size)
 
-    if response.status_code == 200:
-        response_data = response.json()
-        success = response_data.get('success', False)
-        reason = response_data.get('message', 'No reason provided')
+    if status_code == 200:
         if success:
+            record_product_ids(context, [product_id])
             return f"Item with Product ID {product_id} added to cart successfully."
         else:
             return "Item could not be added, Reason: " + reason
     
     return "Trouble adding products to cart"
 
-@function_tool
-def get_all_items_in_cart(context: RunContextWrapper[User]) -> str:
+@function_tool(failure_error_function=node_tool_error)
+async def get_all_items_in_cart(context: RunContextWrapper[User]) -> str:
     """
     Get all items in the user's cart in the Walmart application.
     
@@ -59,20 +111,15 @@ def get_all_items_in_cart(context: RunContextWrapper[User]) -> str:
     jwt_token = context.context.user_jwt
     if not jwt_token:
         return "No user JWT token was provided."
-    url = node_base_url + f"/app/cart"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {jwt_token}"
-    }
-    
-    response = requests.get(url, headers=headers)
+
+    status_code, response_data = await fetch_cart(jwt_token)
 
     cart_items = []
-    if response.status_code == 200:
-        response_data = response.json()
+    if status_code == 200:
         success = response_data.get('success', False)
         if success:
             products = response_data.get('data', {}).get('products', [])
+            record_product_ids(context, (product.get('productId', product.get('_id')) for product in products if product))
             for product in products:
                 if product: 
                     qty = product.get('quantity', "quantity not found")
@@ -92,13 +139,13 @@ def get_all_items_in_cart(context: RunContextWrapper[User]) -> str:
         else:
             return "Failed to fetch cart items, Reason: " + response_data.get('message', 'No reason provided')
     
-    elif response.status_code == 404:
+    elif status_code == 404:
         return "Cart not found."
     
     return "Trouble fetching cart items"
 
-@function_tool
-def remove_all_items(context: RunContextWrapper[User]) -> str:
+@function_tool(failure_error_function=node_tool_error)
+async def remove_all_items(context: RunContextWrapper[User]) -> str:
     """
     Removes all items from the user's cart in the Walmart application.
     
@@ -110,18 +157,17 @@ def remove_all_items(context: RunContextWrapper[User]) -> str:
     jwt_token = context.context.user_jwt
     if not jwt_token:
         return "No user JWT token was provided."
-    url = node_base_url + f"/app/cart/clearCart"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {jwt_token}"
-    }
+    path = "/app/cart/clearCart"
+    headers = auth_headers(jwt_token)
     
-    response = requests.delete(url, headers=headers)
+    response = await node_request("DELETE", path, headers=headers)
+    cart_cache.invalidate("cart", cart_key(jwt_token))
 
     if response.status_code == 200:
         response_data = response.json()
         success = response_data.get('success', False)
         if success:
+            cart_cache.set("cart", cart_key(jwt_token), (200, {"success": True, "data": {"products": []}}))
             return "All items removed from the cart successfully."
         else:
             return "Failed to remove items from cart, Reason: " + response_data.get('message', 'No reason provided')
@@ -131,8 +177,8 @@ def remove_all_items(context: RunContextWrapper[User]) -> str:
     
     return "Trouble removing items from cart"
 
-@function_tool
-def remove_item_from_cart(context: RunContextWrapper[User], product_id: int, color: str = None, size: str = None) -> str:
+@function_tool(failure_error_function=node_tool_error)
+async def remove_item_from_cart(context: RunContextWrapper[User], product_id: int, color: str = None, size: str = None) -> str:
     """
     Remove an item from the user's cart in the Walmart application.
     
@@ -147,27 +193,70 @@ def remove_item_from_cart(context: RunContextWrapper[User], product_id: int, col
     jwt_token = context.context.user_jwt
     if not jwt_token:
         return "No user JWT token was provided."
-    url = node_base_url + f"/app/cart"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {jwt_token}"
-    }
-    
-    payload = {"productId":product_id}
-    if color: payload["color"]=color
-    if size: payload["size"]=size
 
-    response = requests.delete(url, headers=headers, json=payload)
+    status_code, success, reason = await send_cart_item(jwt_token, "DELETE", "/app/cart", product_id, None, color, size)
 
-    if response.status_code == 200:
-        response_data = response.json()
-        success = response_data.get('success', False)
+    if status_code == 200:
         if success:
+            record_product_ids(context, [product_id])
             return f"Item with Product ID {product_id} removed from cart successfully."
         else:
-            return "Failed to remove item from cart, Reason: " + response_data.get('message', 'No reason provided')
+            return "Failed to remove item from cart, Reason: " + reason
     
-    elif response.status_code == 404:
+    elif status_code == 404:
         return "Item not found in cart."
     
-    return "Trouble removing item from cart"
\ No newline at end of file
+    return "Trouble removing item from cart"
+
+def summarize_bulk(items: list[CartItem], results: list, done: str, failed: str) -> str:
+    lines = []
+    succeeded = 0
+    for item, (status_code, success, reason) in zip(items, results):
+        if success:
+            succeeded += 1
+            lines.append(f"- Product ID {item.product_id}: {done}")
+        elif status_code == 404:
+            lines.append(f"- Product ID {item.product_id}: {failed}, Reason: not found")
+        else:
+            lines.append(f"- Product ID {item.product_id}: {failed}, Reason: {reason or 'Trouble reaching the cart service'}")
+    return f"{succeeded} of {len(items)} items {done}:\n" + "\n".join(lines)
+
+@function_tool(failure_error_function=node_tool_error)
+async def add_items_to_cart(context: RunContextWrapper[User], items: list[CartItem]) -> str:
+    """
+    Add several items to the user's cart in the Walmart application in one step.
+    Use this instead of calling add_item_to_cart repeatedly when the user wants more than one product.
+    Args:
+        items (list[CartItem]): Items to add, each with product_id, quantity and optional color and size.
+    """
+    print("-----------------Adding Items To Cart Tool-----------------")
+
+    jwt_token = context.context.user_jwt
+    if not jwt_token:
+        return "No user JWT token was provided."
+    if not items:
+        return "No items were provided."
+
+    results = await send_cart_items(jwt_token, "POST", "/app/cart/add", items)
+    record_product_ids(context, [item.product_id for item, (_, success, _) in zip(items, results) if success])
+    return summarize_bulk(items, results, "added to cart", "could not be added")
+
+@function_tool(failure_error_function=node_tool_error)
+async def remove_items_from_cart(context: RunContextWrapper[User], items: list[CartItem]) -> str:
+    """
+    Remove several items from the user's cart in the Walmart application in one step.
+    Use this instead of calling remove_item_from_cart repeatedly when the user wants more than one product removed.
+    Args:
+        items (list[CartItem]): Items to remove, each with product_id and optional color and size (quantity is ignored).
+    """
+    print("-----------------Removing Items From Cart Tool-----------------")
+
+    jwt_token = context.context.user_jwt
+    if not jwt_token:
+        return "No user JWT token was provided."
+    if not items:
+        return "No items were provided."
+
+    results = await send_cart_items(jwt_token, "DELETE", "/app/cart", items)
+    record_product_ids(context, [item.product_id for item, (_, success, _) in zip(items, results) if success])
+    return summarize_bulk(items, results, "removed from cart", "could not be removed")
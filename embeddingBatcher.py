@@ -0,0 +1,89 @@
+import asyncio
+import os
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent embedding requests into batched embeddings calls.
+    Requests are collected per model for a short window (or until max_batch texts are pending),
+    sent as one multi-input call, and each caller gets its own vector back.
+    Identical texts that are already pending or in flight share one result.
+    """
+    def __init__(self, client_factory, window: float = 0.005, max_batch: int = 64):
+        self.client_factory = client_factory
+        self.window = window
+        self.max_batch = max_batch
+        self.pending = {}
+        self.in_flight = {}
+        self.timers = {}
+        self.tasks = set()
+        self.batches = 0
+        self.items = 0
+        self.deduplicated = 0
+
+    @classmethod
+    def from_env(cls, client_factory):
+        return cls(
+            client_factory,
+            window=float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", 5)) / 1000,
+            max_batch=int(os.getenv("EMBEDDING_BATCH_SIZE", 64)),
+        )
+
+    async def embed(self, text: str, model: str) -> list:
+        key = (model, text)
+        future = self.in_flight.get(key)
+        if future is not None:
+            self.deduplicated += 1
+            return await asyncio.shield(future)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.in_flight[key] = future
+        batch = self.pending.setdefault(model, [])
+        batch.append(text)
+        if len(batch) >= self.max_batch:
+            self._flush(model)
+        elif model not in self.timers:
+            self.timers[model] = loop.call_later(self.window, self._flush, model)
+        return await asyncio.shield(future)
+
+    def _flush(self, model: str):
+        timer = self.timers.pop(model, None)
+        if timer is not None: timer.cancel()
+        texts = self.pending.pop(model, [])
+        if not texts: return
+        task = asyncio.get_running_loop().create_task(self._send(model, texts))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _send(self, model: str, texts: list):
+        self.batches += 1
+        self.items += len(texts)
+        vectors, error = [], None
+        try:
+            response = await self.client_factory().embeddings.create(input=texts, model=model)
+            vectors = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        except BaseException as e:
+            error = e
+            if not isinstance(e, Exception): raise
+        finally:
+            # Every future of the batch is resolved and unregistered, also when the send is cancelled,
+            # so later callers of the same text never wait on a dead future.
+            for row, text in enumerate(texts):
+                future = self.in_flight.pop((model, text), None)
+                if future is None or future.done(): continue
+                if error is None and row < len(vectors):
+                    future.set_result(vectors[row])
+                elif isinstance(error, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(error or RuntimeError(f"Embeddings response had {len(vectors)} vectors for {len(texts)} inputs"))
+                    # Mark the exception retrieved; waiters (if any) still receive it.
+                    future.exception()
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "deduplicated": self.deduplicated,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+        }
@@ -0,0 +1,147 @@
+from sharedState import WriteBehind
+from collections import OrderedDict
+from array import array
+import threading
+import hashlib
+import sqlite3
+import time
+import os
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split()).casefold()
+
+def cache_key(text: str, model: str) -> str:
+    return hashlib.sha256(f"{model}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """
+    Two-tier cache for embedding vectors keyed on normalized text plus model.
+    Tier one is an in-process LRU bounded by entry count and TTL.
+    Tier two is an optional SQLite file holding float32 vectors, so entries survive restarts.
+    """
+    def __init__(self, max_size: int = 10000, ttl: float = 86400, path: str = None, disk_ttl: float = 30 * 86400):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.disk_ttl = disk_ttl
+        self.path = path
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.db = None
+        self.writer = None
+        if path: self._open_db(path)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_size=int(os.getenv("EMBEDDING_CACHE_SIZE", 10000)),
+            ttl=float(os.getenv("EMBEDDING_CACHE_TTL", 86400)),
+            # Embeddings never change, so workers can simply share the SQLite tier.
+            path=os.getenv("EMBEDDING_CACHE_PATH") or os.getenv("SHARED_STATE_PATH") or None,
+            disk_ttl=float(os.getenv("EMBEDDING_CACHE_DISK_TTL", 30 * 86400)),
+        )
+
+    def _open_db(self, path: str):
+        self.db = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                created REAL NOT NULL
+            )
+        """)
+        self.db.commit()
+        # Disk writes are queued and committed in batches off the caller's thread.
+        self.writer = WriteBehind(path, name="embedding-cache-writer")
+
+    def _remember(self, key: str, vector: list, created: float):
+        self.entries[key] = (vector, created)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def get(self, text: str, model: str):
+        key = cache_key(text, model)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                vector, created = entry
+                if now - created <= self.ttl:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return vector
+                del self.entries[key]
+
+            if self.db is not None:
+                row = self.db.execute("SELECT vector, created FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row is not None and now - row[1] <= self.disk_ttl:
+                    vector = array("f")
+                    vector.frombytes(row[0])
+                    vector = vector.tolist()
+                    self._remember(key, vector, now)
+                    self.disk_hits += 1
+                    return vector
+
+            self.misses += 1
+            return None
+
+    def set(self, text: str, model: str, vector: list):
+        key = cache_key(text, model)
+        now = time.time()
+        with self.lock:
+            self._remember(key, vector, now)
+            if self.writer is not None:
+                self.writer.put(
+                    "INSERT OR REPLACE INTO embeddings (key, model, vector, created) VALUES (?, ?, ?, ?)",
+                    (key, model, array("f", vector).tobytes(), now),
+                )
+
+    def snapshot(self, limit: int = 1000) -> list:
+        """
+        Return up to limit (key, vector) pairs of the most recently used entries, newest first.
+        """
+        with self.lock:
+            keys = list(reversed(self.entries))[:limit]
+            return [(key, self.entries[key][0]) for key in keys]
+
+    def preload(self, entries: list) -> int:
+        """
+        Put snapshot entries back into the in-memory tier, keeping the given order as recency.
+        """
+        now = time.time()
+        with self.lock:
+            for key, vector in reversed(entries): self._remember(key, vector, now)
+        return len(entries)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            if self.writer is not None: self.writer.put("DELETE FROM embeddings")
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "size": len(self.entries),
+                "max_size": self.max_size,
+                "persistent": self.db is not None,
+                "disk_writer": self.writer.stats() if self.writer is not None else None,
+            }
+
+    def close(self):
+        if self.writer is not None: self.writer.close()
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+embedding_cache = EmbeddingCache.from_env()
@@ -0,0 +1,214 @@
+"""
+Catalog embedding ingestion: fills and refreshes the embedding field of Spark.products.
+
+Streams products in _id order and embeds the embedding_text of those that are new or edited,
+with multi-input embeddings calls run with bounded concurrency. The async OpenAI client already
+throttles to OPENAI_RPM / OPENAI_TPM. Results are written with bulk_write, together with a hash of
+model and text, so unchanged products are skipped on the next run. Products that already have an
+embedding but no hash are taken as current and only get the hash, unless --full is given.
+
+Progress is checkpointed in Spark.ingest_checkpoints after every batch that completes in order.
+A crashed or interrupted run resumes after the last checkpointed _id, and a finished run clears
+the checkpoint.
+
+    uv run python -m embeddingIngest                    # embed new and edited products
+    uv run python -m embeddingIngest --full             # re-embed every product
+    uv run python -m embeddingIngest --restart          # ignore the checkpoint of an unfinished run
+"""
+from embeddingProfile import EmbeddingProfile, embedding_profile
+from datetime import datetime, timezone
+from pymongo import UpdateOne
+import argparse
+import hashlib
+import asyncio
+import time
+import os
+
+def text_hash(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\n{text}".encode()).hexdigest()
+
+class EmbeddingIngest:
+    def __init__(self, collection, checkpoints, client_factory, profile: EmbeddingProfile = None, batch_size: int = 256, concurrency: int = 4, hash_field: str = "embedding_hash", updated_field: str = "updatedAt", full: bool = False):
+        self.collection = collection
+        self.checkpoints = checkpoints
+        self.client_factory = client_factory
+        self.profile = profile or EmbeddingProfile()
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.hash_field = hash_field
+        self.updated_field = updated_field
+        self.full = full
+        self.checkpoint_id = f"{collection.name}:{self.profile.source_field}"
+        self.counts = {"read": 0, "embedded": 0, "stamped": 0, "unchanged": 0, "empty": 0, "tokens": 0}
+        self.started = None
+        self.last_report = 0.0
+        self.last_id = None
+        # Batches finish out of order; the checkpoint only moves past batches that all finished.
+        self.batch_last_ids = {}
+        self.finished = set()
+        self.next_batch = 0
+        self.error = None
+
+    @classmethod
+    def from_env(cls, collection, checkpoints, client_factory, **overrides):
+        settings = dict(
+            profile=embedding_profile,
+            batch_size=int(os.getenv("EMBEDDING_INGEST_BATCH_SIZE", 256)),
+            concurrency=int(os.getenv("EMBEDDING_INGEST_CONCURRENCY", 4)),
+            hash_field=os.getenv("EMBEDDING_HASH_FIELD", "embedding_hash"),
+            updated_field=os.getenv("VECTOR_INDEX_UPDATED_FIELD", "updatedAt"),
+        )
+        settings.update({key: value for key, value in overrides.items() if value is not None})
+        return cls(collection, checkpoints, client_factory, **settings)
+
+    def load_checkpoint(self):
+        checkpoint = self.checkpoints.find_one({"_id": self.checkpoint_id})
+        return None if checkpoint is None else checkpoint.get("last_id")
+
+    def save_checkpoint(self):
+        self.checkpoints.replace_one(
+            {"_id": self.checkpoint_id},
+            {"_id": self.checkpoint_id, "last_id": self.last_id, "counts": self.counts, "full": self.full, "updated": datetime.now(timezone.utc)},
+            upsert=True,
+        )
+
+    def clear_checkpoint(self):
+        self.checkpoints.delete_one({"_id": self.checkpoint_id})
+
+    def read_batch(self, cursor) -> list:
+        batch = []
+        for product in cursor:
+            batch.append(product)
+            if len(batch) >= self.batch_size: break
+        return batch
+
+    def plan(self, products: list):
+        """
+        Split a batch into products to embed [(product_id, text, hash)] and hash-only updates.
+        """
+        to_embed, stamps = [], []
+        for product in products:
+            text = (product.get("embedding_text") or "").replace("\n", " ")
+            if not text.strip():
+                self.counts["empty"] += 1
+                continue
+            digest = text_hash(self.profile.model, text)
+            stored = product.get(self.hash_field)
+            has_embedding = bool(product.get(self.profile.source_field))
+            if self.full or (stored is not None and stored != digest) or not has_embedding:
+                to_embed.append((product["_id"], text, digest))
+            elif stored is None:
+                stamps.append(UpdateOne({"_id": product["_id"]}, {"$set": {self.hash_field: digest}}))
+            else:
+                self.counts["unchanged"] += 1
+        return to_embed, stamps
+
+    async def embed(self, texts: list) -> list:
+        response = await self.client_factory().embeddings.create(input=texts, model=self.profile.model)
+        self.counts["tokens"] += getattr(response.usage, "total_tokens", 0) or 0
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    def updates(self, to_embed: list, vectors: list) -> list:
+        now = datetime.now(timezone.utc)
+        reduced = self.profile.reduce(vectors) if self.profile.field != self.profile.source_field else None
+        operations = []
+        for row, ((product_id, _, digest), vector) in enumerate(zip(to_embed, vectors)):
+            update = {self.profile.source_field: vector, self.hash_field: digest}
+            if reduced is not None: update[self.profile.field] = reduced[row].tolist()
+            # Bump the updated field so the local vector index picks the new vector up on its next refresh.
+            if self.updated_field: update[self.updated_field] = now
+            operations.append(UpdateOne({"_id": product_id}, {"$set": update}))
+        return operations
+
+    async def process(self, number: int, products: list, semaphore: asyncio.Semaphore):
+        try:
+            to_embed, operations = self.plan(products)
+            if to_embed:
+                vectors = await self.embed([text for _, text, _ in to_embed])
+                operations += self.updates(to_embed, vectors)
+            if operations: await asyncio.to_thread(self.collection.bulk_write, operations, ordered=False)
+            self.counts["embedded"] += len(to_embed)
+            self.counts["stamped"] += len(operations) - len(to_embed)
+            self.finished.add(number)
+            await self.advance()
+        except Exception as e:
+            self.error = self.error or e
+        finally:
+            semaphore.release()
+
+    async def advance(self):
+        moved = False
+        while self.next_batch in self.finished:
+            self.finished.discard(self.next_batch)
+            self.last_id = self.batch_last_ids.pop(self.next_batch)
+            self.next_batch += 1
+            moved = True
+        if moved: await asyncio.to_thread(self.save_checkpoint)
+        if time.perf_counter() - self.last_report >= 5: self.report()
+
+    async def run(self, restart: bool = False, limit: int = None) -> dict:
+        self.started = self.last_report = time.perf_counter()
+        self.last_id = None if restart else await asyncio.to_thread(self.load_checkpoint)
+        if self.last_id is not None: print(f"Resuming after _id {self.last_id!r}")
+        query = {} if self.last_id is None else {"_id": {"$gt": self.last_id}}
+        projection = {"_id": 1, "embedding_text": 1, self.hash_field: 1, self.profile.source_field: {"$slice": 1}}
+        cursor = self.collection.find(query, projection, sort=[("_id", 1)], batch_size=self.batch_size)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+        number = 0
+        try:
+            while limit is None or self.counts["read"] < limit:
+                await semaphore.acquire()
+                products = None if self.error else await asyncio.to_thread(self.read_batch, cursor)
+                if not products:
+                    semaphore.release()
+                    break
+                self.counts["read"] += len(products)
+                self.batch_last_ids[number] = products[-1]["_id"]
+                task = asyncio.create_task(self.process(number, products, semaphore))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                number += 1
+            await asyncio.gather(*tasks)
+        finally:
+            cursor.close()
+        if self.error is not None:
+            self.report()
+            raise self.error
+        if limit is None: await asyncio.to_thread(self.clear_checkpoint)
+        self.report()
+        return self.counts
+
+    def report(self):
+        self.last_report = time.perf_counter()
+        elapsed = max(self.last_report - self.started, 1e-9)
+        counts = self.counts
+        print(
+            f"{counts['read']} read, {counts['embedded']} embedded, {counts['stamped']} hash-only, {counts['unchanged']} unchanged, {counts['empty']} without text"
+            f" | {counts['read'] / elapsed:.0f} products/s, {counts['embedded'] / elapsed:.1f} embeddings/s, {counts['tokens'] / elapsed:.0f} tokens/s, {elapsed:.1f}s"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--full", action="store_true", help="re-embed every product, ignoring stored hashes")
+    parser.add_argument("--restart", action="store_true", help="start from the first product instead of the checkpoint")
+    parser.add_argument("--batch-size", type=int, help="products per embeddings call (EMBEDDING_INGEST_BATCH_SIZE, default 256)")
+    parser.add_argument("--concurrency", type=int, help="embeddings calls in flight (EMBEDDING_INGEST_CONCURRENCY, default 4)")
+    parser.add_argument("--limit", type=int, help="stop after reading about this many products, keeping the checkpoint")
+    args = parser.parse_args()
+
+    import utils
+    database = utils.get_mongo_client().get_database("Spark")
+    ingest = EmbeddingIngest.from_env(
+        database.get_collection("products"),
+        database.get_collection("ingest_checkpoints"),
+        utils.get_async_openai_client,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        full=args.full,
+    )
+    asyncio.run(ingest.run(restart=args.restart, limit=args.limit))
+
+if __name__ == "__main__":
+    main()
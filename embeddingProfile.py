@@ -0,0 +1,157 @@
+"""
+Embedding profile: dimensions and quantization used for catalog and query vectors.
+
+text-embedding-3 vectors can be shortened by keeping their first `dimensions` values and
+re-normalizing, which gives the same vectors the API returns for its dimensions parameter.
+Reduced vectors are therefore derived from the stored full ones, both for the catalog (the
+migration below writes them to their own field) and for queries (the cached full query vector is
+reduced before searching), so the embedding cache and batcher keep working on full vectors.
+
+Quantization (int8 or binary) ranks candidates with compact codes and rescores the best
+k * rescore of them with the float vectors. In Atlas it selects the quantized vector index.
+
+    uv run python -m embeddingProfile                   # write reduced vectors for products missing them
+    uv run python -m embeddingProfile --full            # rewrite every product
+    uv run python -m embeddingProfile --create-index    # also create the Atlas vector index for the profile
+"""
+from pymongo import UpdateOne
+import numpy as np
+import argparse
+import json
+import time
+import os
+
+QUANTIZATIONS = ("none", "int8", "binary")
+MODEL_DIMENSIONS = {"text-embedding-3-large": 3072, "text-embedding-3-small": 1536}
+
+class EmbeddingProfile:
+    def __init__(self, dimensions: int = None, quantization: str = "none", rescore: int = 4, field: str = None, index: str = None, source_field: str = "embedding", model: str = "text-embedding-3-large"):
+        if quantization not in QUANTIZATIONS: raise ValueError(f"EMBEDDING_QUANTIZATION must be one of {QUANTIZATIONS}, got {quantization!r}")
+        self.dimensions = dimensions
+        self.quantization = quantization
+        self.rescore = rescore
+        self.source_field = source_field
+        self.field = field or (f"{source_field}_{dimensions}" if dimensions else source_field)
+        self.index = index or (f"vector_index_{dimensions}" if dimensions else "vector_index")
+        self.model = model
+
+    @classmethod
+    def from_env(cls):
+        dimensions = os.getenv("EMBEDDING_DIMENSIONS")
+        return cls(
+            dimensions=int(dimensions) if dimensions else None,
+            quantization=os.getenv("EMBEDDING_QUANTIZATION", "none"),
+            rescore=int(os.getenv("EMBEDDING_RESCORE_FACTOR", 4)),
+            field=os.getenv("EMBEDDING_FIELD"),
+            index=os.getenv("VECTOR_SEARCH_INDEX"),
+        )
+
+    @property
+    def reduced(self) -> bool:
+        return self.dimensions is not None
+
+    @property
+    def quantized(self) -> bool:
+        return self.quantization != "none"
+
+    def reduce(self, vectors) -> np.ndarray:
+        """
+        Truncate one vector or a matrix of row vectors to the profile dimensions and L2-normalize.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.reduced: vectors = vectors[..., :self.dimensions]
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1.0, norms)
+
+    def quantize(self, matrix: np.ndarray):
+        """
+        Return (codes, scales) for the scan: int8 codes with one scale per row, or packed sign bits
+        (scales None) for binary. None when the profile is not quantized.
+        """
+        if self.quantization == "int8":
+            scales = np.abs(matrix).max(axis=1) / 127
+            scales[scales == 0] = 1.0
+            return np.round(matrix / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        if self.quantization == "binary":
+            return np.packbits(matrix > 0, axis=1), None
+        return None
+
+    def approximate_scores(self, codes: np.ndarray, scales: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """
+        Scores of the code rows for a (reduced, normalized) float query; only their order matters.
+        """
+        if self.quantization == "int8":
+            query_codes = np.round(query * (127 / (np.abs(query).max() or 1.0))).astype(np.int32)
+            return np.einsum("ij,j->i", codes, query_codes) * scales
+        # Binary: fewer differing sign bits means a closer vector.
+        return -np.bitwise_count(codes ^ np.packbits(query > 0)).sum(axis=1, dtype=np.int32)
+
+    def index_definition(self) -> dict:
+        field = {
+            "type": "vector",
+            "path": self.field,
+            "numDimensions": self.dimensions or MODEL_DIMENSIONS.get(self.model, 3072),
+            "similarity": "cosine",
+        }
+        if self.quantized: field["quantization"] = "scalar" if self.quantization == "int8" else "binary"
+        return {"fields": [field]}
+
+    def stats(self) -> dict:
+        return {
+            "dimensions": self.dimensions or MODEL_DIMENSIONS.get(self.model, 3072),
+            "quantization": self.quantization,
+            "rescore": self.rescore,
+            "field": self.field,
+            "index": self.index,
+        }
+
+def migrate(collection, profile: EmbeddingProfile, full: bool = False, batch_size: int = 500) -> int:
+    """
+    Write profile-reduced vectors of the source field to profile.field, for products missing them
+    or for every product with full=True. Returns the number of products written.
+    """
+    if profile.field == profile.source_field: return 0
+    query = {profile.source_field: {"$exists": True}}
+    if not full: query[profile.field] = {"$exists": False}
+
+    written, batch = 0, []
+    def flush():
+        nonlocal written, batch
+        vectors = profile.reduce([vector for _, vector in batch])
+        collection.bulk_write([UpdateOne({"_id": product_id}, {"$set": {profile.field: vector.tolist()}}) for (product_id, _), vector in zip(batch, vectors)], ordered=False)
+        written += len(batch)
+        batch = []
+
+    for product in collection.find(query, {"_id": 1, profile.source_field: 1}, batch_size=batch_size):
+        batch.append((product["_id"], product[profile.source_field]))
+        if len(batch) >= batch_size: flush()
+    if batch: flush()
+    return written
+
+def create_index(collection, profile: EmbeddingProfile):
+    from pymongo.operations import SearchIndexModel
+    collection.create_search_index(SearchIndexModel(definition=profile.index_definition(), name=profile.index, type="vectorSearch"))
+
+embedding_profile = EmbeddingProfile.from_env()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--full", action="store_true", help="rewrite every product instead of only those missing the reduced field")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--create-index", action="store_true", help="create the Atlas vector index for the profile after migrating")
+    args = parser.parse_args()
+
+    import utils
+    collection = utils.get_products_collection()
+    print(f"Profile: {embedding_profile.stats()}")
+    start = time.perf_counter()
+    written = migrate(collection, embedding_profile, full=args.full, batch_size=args.batch_size)
+    print(f"Wrote {written} reduced vectors to {embedding_profile.field} in {time.perf_counter() - start:.1f}s")
+    if args.create_index:
+        create_index(collection, embedding_profile)
+        print(f"Created vector index {embedding_profile.index}")
+    else:
+        print(f"Atlas vector index {embedding_profile.index}:\n{json.dumps(embedding_profile.index_definition(), indent=2)}")
+
+if __name__ == "__main__":
+    main()
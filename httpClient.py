@@ -0,0 +1,121 @@
+from utils import get_node_base_uri
+from nodeResilience import node_resilience, node_hedges, node_short_circuits, BackendUnavailable
+from tracing import aspan
+import asyncio
+import httpx
+import time
+import os
+
+# One keep-alive connection pool per process, shared by every Node backend tool.
+_node_client = None
+
+def get_node_timeout(default: float = None) -> httpx.Timeout:
+    total = float(os.getenv("NODE_HTTP_TIMEOUT", default or 10.0))
+    connect = float(os.getenv("NODE_HTTP_CONNECT_TIMEOUT", min(total, 5.0)))
+    return httpx.Timeout(total, connect=connect)
+
+def get_node_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=int(os.getenv("NODE_HTTP_MAX_CONNECTIONS", 100)),
+        max_keepalive_connections=int(os.getenv("NODE_HTTP_MAX_KEEPALIVE", 20)),
+        keepalive_expiry=float(os.getenv("NODE_HTTP_KEEPALIVE_EXPIRY", 30.0)),
+    )
+
+def get_node_client() -> httpx.AsyncClient:
+    global _node_client
+    if _node_client is None or _node_client.is_closed:
+        _node_client = httpx.AsyncClient(
+            base_url=get_node_base_uri(),
+            headers={"Content-Type": "application/json"},
+            timeout=get_node_timeout(),
+            limits=get_node_limits(),
+        )
+    return _node_client
+
+async def close_node_client():
+    global _node_client
+    if _node_client is not None and not _node_client.is_closed:
+        await _node_client.aclose()
+    _node_client = None
+
+def auth_headers(jwt_token: str) -> dict:
+    return {"Authorization": f"Bearer {jwt_token}"}
+
+async def node_request(method: str, path: str, timeout: float = None, **kwargs) -> httpx.Response:
+    """
+    Send a request to the Node backend through the shared pool.
+    Fails fast with BackendUnavailable while the endpoint's circuit breaker is open, and hedges
+    idempotent search reads that run past the endpoint's recent p95 latency.
+    Args:
+        method (str): HTTP method, e.g. "GET".
+        path (str): Path relative to NODE_BASE_URI, e.g. "/app/cart".
+        timeout (float, optional): Per-call timeout in seconds, overrides NODE_SEARCH_TIMEOUT / NODE_CART_TIMEOUT / NODE_HTTP_TIMEOUT.
+    """
+    client = get_node_client()
+    label = endpoint_label(method, path)
+    endpoint = node_resilience.endpoint(label)
+    # A half-open breaker lets one trial through; only the call that took it may give it back.
+    trial = endpoint.breaker.state == "half_open"
+    if not endpoint.breaker.allow():
+        endpoint.short_circuited += 1
+        node_short_circuits.inc(endpoint=label)
+        raise BackendUnavailable(path, endpoint.breaker.retry_after())
+
+    timeout = timeout if timeout is not None else node_resilience.timeout_for(path)
+    if timeout is not None:
+        kwargs["timeout"] = httpx.Timeout(timeout, connect=min(timeout, client.timeout.connect or timeout))
+    async with aspan("node_http", label):
+        delay = node_resilience.hedge_delay(method, path, endpoint, timeout or client.timeout.read)
+        if delay is None: return await send(client, endpoint, method, path, trial=trial, **kwargs)
+        return await hedged_send(client, endpoint, label, delay, method, path, trial=trial, **kwargs)
+
+async def send(client: httpx.AsyncClient, endpoint, method: str, path: str, trial: bool = False, **kwargs) -> httpx.Response:
+    # Timeouts, connection errors and 5xx answers count against the endpoint's circuit breaker.
+    start = time.perf_counter()
+    try:
+        response = await client.request(method, path, **kwargs)
+    except httpx.TimeoutException:
+        endpoint.record(time.perf_counter() - start, ok=False, timeout=True)
+        raise
+    except httpx.HTTPError:
+        endpoint.record(time.perf_counter() - start, ok=False)
+        raise
+    except BaseException:
+        # Cancelled (e.g. the losing hedge) or not the backend's fault: the breaker state stays as it
+        # was, and a trial this call took is handed back for the next call.
+        if trial: endpoint.breaker.trial_in_flight = False
+        raise
+    endpoint.record(time.perf_counter() - start, ok=response.status_code < 500)
+    return response
+
+async def hedged_send(client: httpx.AsyncClient, endpoint, label: str, delay: float, method: str, path: str, trial: bool = False, **kwargs) -> httpx.Response:
+    """
+    Send the request, and a duplicate if no answer came within delay seconds.
+    The first good response wins and the other request is cancelled.
+    """
+    primary = asyncio.create_task(send(client, endpoint, method, path, trial=trial, **kwargs))
+    pending = {primary}
+    try:
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if done: return primary.result()
+
+        endpoint.hedged += 1
+        backup = asyncio.create_task(send(client, endpoint, method, path, **kwargs))
+        pending = {primary, backup}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None and task.result().status_code < 500:
+                    winner = "backup" if task is backup else "primary"
+                    endpoint.hedge_wins += int(task is backup)
+                    node_hedges.inc(endpoint=label, winner=winner)
+                    return task.result()
+        # Both failed: surface the primary's answer or error.
+        node_hedges.inc(endpoint=label, winner="none")
+        return primary.result()
+    finally:
+        for task in pending: task.cancel()
+
+def endpoint_label(method: str, path: str) -> str:
+    # Keep ids and categories out of metric labels: /app/search/id/42 -> GET /app/search/id
+    return f"{method} {'/'.join(path.split('?')[0].split('/')[:4])}"
@@ -0,0 +1,168 @@
+from collections import Counter
+import numpy as np
+import threading
+import time
+import re
+import os
+
+TOKEN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("a an and are as at be by for from has in is it of on or the to with".split())
+
+def tokenize(text: str) -> list:
+    return [token for token in TOKEN.findall((text or "").lower()) if token not in STOPWORDS]
+
+def reciprocal_rank_fusion(rankings: list, k: int = 60) -> list:
+    """
+    Fuse ranked id lists: score(id) = sum over lists of 1 / (k + rank). Returns [(id, score)], best first.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, product_id in enumerate(ranking, start=1):
+            scores[product_id] = scores.get(product_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+class LexicalIndex:
+    """
+    In-memory BM25 index over the catalog's embedding_text.
+    Postings are stored CSR-style: for term t, docs[indptr[t]:indptr[t+1]] holds the documents and
+    weights[...] their precomputed BM25 weight (idf included), so a query is a few array adds.
+    """
+    def __init__(self, k1: float = 1.2, b: float = 0.75, updated_field: str = "updatedAt"):
+        self.k1 = k1
+        self.b = b
+        self.updated_field = updated_field
+        self.lock = threading.Lock()
+        self.ids = []
+        self.texts = []
+        self.id_to_row = {}
+        self.categories = []
+        self.category_codes = np.zeros(0, dtype=np.int32)
+        self.vocabulary = {}
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.docs = np.zeros(0, dtype=np.int32)
+        self.weights = np.zeros(0, dtype=np.float32)
+        self.last_updated = None
+        self.loaded_at = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            k1=float(os.getenv("LEXICAL_BM25_K1", 1.2)),
+            b=float(os.getenv("LEXICAL_BM25_B", 0.75)),
+            updated_field=os.getenv("VECTOR_INDEX_UPDATED_FIELD", "updatedAt"),
+        )
+
+    @property
+    def ready(self) -> bool:
+        return self.loaded_at is not None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def load(self, collection):
+        """
+        Build the index from the products collection.
+        """
+        projection = {"_id": 1, "embedding_text": 1, "category": 1}
+        if self.updated_field: projection[self.updated_field] = 1
+        ids, texts, categories, last_updated = [], [], [], None
+        for product in collection.find({}, projection, batch_size=1000):
+            ids.append(product["_id"])
+            texts.append(product.get("embedding_text", ""))
+            categories.append(product.get("category"))
+            updated = product.get(self.updated_field) if self.updated_field else None
+            if updated is not None and (last_updated is None or updated > last_updated): last_updated = updated
+        self.build(ids, texts, categories)
+        self.last_updated = last_updated
+
+    def refresh(self, collection) -> int:
+        """
+        Rebuild when products changed since the last load (a rebuild takes about as long as
+        reading the changes). Returns the number of changed products.
+        """
+        if not self.ready or not self.updated_field or self.last_updated is None:
+            self.load(collection)
+            return len(self)
+        changed = sum(1 for _ in collection.find({self.updated_field: {"$gt": self.last_updated}}, {"_id": 1}))
+        if changed: self.load(collection)
+        return changed
+
+    def build(self, ids: list, texts: list, categories: list = None):
+        categories = categories or [None] * len(ids)
+        vocabulary, term_ids, doc_ids, counts = {}, [], [], []
+        lengths = np.zeros(len(ids), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[row] = len(tokens)
+            for token, count in Counter(tokens).items():
+                term_ids.append(vocabulary.setdefault(token, len(vocabulary)))
+                doc_ids.append(row)
+                counts.append(count)
+
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind="stable")
+        term_ids = term_ids[order]
+        docs = np.asarray(doc_ids, dtype=np.int32)[order]
+        tf = np.asarray(counts, dtype=np.float32)[order]
+        document_frequency = np.bincount(term_ids, minlength=len(vocabulary)).astype(np.float32)
+        idf = np.log1p((len(ids) - document_frequency + 0.5) / (document_frequency + 0.5))
+        average_length = float(lengths.mean()) if len(ids) else 1.0
+        norm = self.k1 * (1 - self.b + self.b * lengths[docs] / (average_length or 1.0))
+        weights = (idf[term_ids] * tf * (self.k1 + 1) / (tf + norm)).astype(np.float32)
+        indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(document_frequency.astype(np.int64), out=indptr[1:])
+
+        category_names = sorted({category for category in categories if category}, key=str)
+        category_index = {category.casefold(): code for code, category in enumerate(category_names)}
+        with self.lock:
+            self.ids = list(ids)
+            self.texts = list(texts)
+            self.id_to_row = {product_id: row for row, product_id in enumerate(self.ids)}
+            self.categories = category_names
+            self.category_codes = np.asarray([category_index.get(str(category).casefold(), -1) if category else -1 for category in categories], dtype=np.int32)
+            self.vocabulary = vocabulary
+            self.indptr, self.docs, self.weights = indptr, docs, weights
+            self.loaded_at = time.time()
+
+    def category_of(self, product_id):
+        row = self.id_to_row.get(product_id)
+        if row is None or self.category_codes[row] < 0: return None
+        return self.categories[self.category_codes[row]]
+
+    def category_code(self, category: str) -> int:
+        # Unknown categories map to -2 so that filtering by them matches nothing.
+        for code, name in enumerate(self.categories):
+            if name.casefold() == category.casefold(): return code
+        return -2
+
+    def search(self, query: str, k: int = 10, category: str = None) -> list:
+        """
+        Return up to k (product_id, embedding_text, bm25 score) tuples, best first.
+        """
+        with self.lock:
+            ids, texts, vocabulary = self.ids, self.texts, self.vocabulary
+            indptr, docs, weights, codes = self.indptr, self.docs, self.weights, self.category_codes
+        if not ids: return []
+        scores = np.zeros(len(ids), dtype=np.float32)
+        for token in set(tokenize(query)):
+            term = vocabulary.get(token)
+            if term is None: continue
+            start, end = indptr[term], indptr[term + 1]
+            scores[docs[start:end]] += weights[start:end]
+        if category: scores[codes != self.category_code(category)] = 0.0
+        candidates = np.flatnonzero(scores > 0)
+        if not len(candidates): return []
+        best = candidates[np.argsort(-scores[candidates])[:k]]
+        return [(ids[row], texts[row], float(scores[row])) for row in best]
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "size": len(self),
+            "terms": len(self.vocabulary),
+            "postings": int(len(self.docs)),
+            "categories": len(self.categories),
+            "loaded_at": self.loaded_at,
+        }
+
+lexical_index = LexicalIndex.from_env()
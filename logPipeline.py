@@ -0,0 +1,237 @@
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+from collections import deque
+from contextvars import ContextVar
+from itertools import islice
+import threading
+import logging
+import queue
+import json
+import time
+import os
+
+# Per-request fields stamped on log records. The dict is shared (not copied) with tasks spawned by
+# the request, so fields set by the endpoint are visible to the access log written by the middleware.
+log_context = ContextVar("log_context", default=None)
+
+def bind_request(request_id: str):
+    return log_context.set({"request_id": request_id, "user": None})
+
+def set_log_user(user: str):
+    context = log_context.get()
+    if context is not None: context["user"] = user
+
+# Attributes every LogRecord has; anything else was passed through `extra` and goes into the JSON record.
+RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+class LogStore:
+    """
+    Bounded in-memory ring buffer of recent log records for the /logs endpoints.
+    """
+    def __init__(self, maxlen: int = 1000):
+        self.logs = deque(maxlen=maxlen)
+        self.lock = threading.Lock()
+
+    def add_log(self, log: str, record: dict = None):
+        with self.lock:
+            self.logs.append((record or {}, log))
+
+    def clear_logs(self):
+        with self.lock:
+            self.logs.clear()
+
+    def query(self, n: int = None, level: str = None, since: float = None, until: float = None, structured: bool = False) -> list:
+        """
+        Return the last n matching entries, oldest first. Walks the buffer from the newest end,
+        so unfiltered reads cost O(n) regardless of the buffer size.
+        Args:
+            level (str, optional): Minimum level name, e.g. "WARNING".
+            since, until (float, optional): Unix timestamps bounding the record time.
+        """
+        min_level = logging.getLevelName(level.upper()) if level else None
+        if not isinstance(min_level, int): min_level = None
+        with self.lock:
+            entries = reversed(self.logs)
+            if min_level is not None or since is not None or until is not None:
+                entries = (
+                    (record, log) for record, log in entries
+                    if (min_level is None or record.get("levelno", 0) >= min_level)
+                    and (since is None or record.get("created", 0) >= since)
+                    and (until is None or record.get("created", 0) <= until)
+                )
+            if n is not None: entries = islice(entries, max(n, 0))
+            selected = list(entries)
+        selected.reverse()
+        return [record if structured else log for record, log in selected]
+
+    def get_last_n_logs(self, n: int):
+        return self.query(n=n)
+
+    def get_logs(self):
+        return self.query()
+
+class SharedLogStore:
+    """
+    LogStore kept in a SQLite file shared by the workers, so /logs shows the records of every worker
+    whichever worker serves the request. Keeps roughly the newest maxlen records.
+    The file is separate from the SharedState caches, and records are inserted in batches by a
+    writer thread, so logging does not compete with cache writes for the write lock.
+    """
+    def __init__(self, path: str, maxlen: int = 1000):
+        from sharedState import connect, WriteBehind
+        self.path = path
+        self.maxlen = maxlen
+        self.lock = threading.Lock()
+        self.db = connect(path)
+        self.inserts = 0
+        with self.lock:
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS logs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    created REAL NOT NULL,
+                    levelno INTEGER NOT NULL,
+                    line TEXT NOT NULL,
+                    record TEXT NOT NULL
+                )
+            """)
+            self.db.execute("CREATE INDEX IF NOT EXISTS logs_created ON logs (created)")
+            self.db.commit()
+        self.writer = WriteBehind(path, name="log-store-writer")
+
+    @staticmethod
+    def default_path(shared_path: str) -> str:
+        root, ext = os.path.splitext(shared_path)
+        return f"{root}-logs{ext or '.sqlite'}"
+
+    def add_log(self, log: str, record: dict = None):
+        record = record or {}
+        self.writer.put(
+            "INSERT INTO logs (created, levelno, line, record) VALUES (?, ?, ?, ?)",
+            (record.get("created", time.time()), record.get("levelno", 0), log, json.dumps(record, default=str)),
+        )
+        self.inserts += 1
+        # Trim in steps instead of on every insert.
+        if self.inserts % 100 == 0: self.writer.put("DELETE FROM logs WHERE id <= (SELECT MAX(id) FROM logs) - ?", (self.maxlen,))
+
+    def clear_logs(self):
+        self.writer.put("DELETE FROM logs")
+        self.writer.flush()
+
+    def close(self):
+        self.writer.close()
+
+    def query(self, n: int = None, level: str = None, since: float = None, until: float = None, structured: bool = False) -> list:
+        min_level = logging.getLevelName(level.upper()) if level else None
+        if not isinstance(min_level, int): min_level = None
+        limit = self.maxlen if n is None else max(min(n, self.maxlen), 0)
+        conditions, params = [], []
+        if min_level is not None: conditions.append("levelno >= ?"); params.append(min_level)
+        if since is not None: conditions.append("created >= ?"); params.append(since)
+        if until is not None: conditions.append("created <= ?"); params.append(until)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self.lock:
+            rows = self.db.execute(f"SELECT line, record FROM logs {where} ORDER BY id DESC LIMIT ?", (*params, limit)).fetchall()
+        rows.reverse()
+        return [json.loads(record) if structured else line for line, record in rows]
+
+    def get_last_n_logs(self, n: int):
+        return self.query(n=n)
+
+    def get_logs(self):
+        return self.query()
+
+class ContextFilter(logging.Filter):
+    """
+    Stamps records with the request id and user of the current request. Runs on the logging
+    thread before the record is queued, so the request's context variables are visible.
+    """
+    def filter(self, record):
+        context = log_context.get() or {}
+        if not hasattr(record, "request_id"): record.request_id = context.get("request_id")
+        if not hasattr(record, "user"): record.user = context.get("user")
+        return True
+
+def record_to_dict(record: logging.LogRecord) -> dict:
+    data = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+        "created": record.created,
+        "level": record.levelname,
+        "levelno": record.levelno,
+        "logger": record.name,
+        "message": record.getMessage(),
+    }
+    for key, value in vars(record).items():
+        if key not in RESERVED_ATTRS and value is not None: data[key] = value
+    if record.exc_info: data["exc_info"] = logging.Formatter().formatException(record.exc_info)
+    return data
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps(record_to_dict(record), default=str)
+
+class LogStoreHandler(logging.Handler):
+    def __init__(self, store: LogStore):
+        super().__init__()
+        self.store = store
+
+    def emit(self, record):
+        self.store.add_log(self.format(record), record_to_dict(record))
+
+class SizedTimedRotatingFileHandler(TimedRotatingFileHandler):
+    """
+    Rotates at the configured time interval or once the file exceeds max_bytes, whichever comes first.
+    """
+    def __init__(self, filename, max_bytes: int = 0, **kwargs):
+        super().__init__(filename, **kwargs)
+        self.max_bytes = max_bytes
+
+    def shouldRollover(self, record):
+        if super().shouldRollover(record): return True
+        if self.max_bytes > 0 and self.stream is not None:
+            self.stream.seek(0, 2)
+            return self.stream.tell() >= self.max_bytes
+        return False
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Never blocks the caller: when the queue is full the record is dropped and counted.
+    """
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+def setup_logging(name: str, store: LogStore, log_path: str):
+    """
+    Route the named logger through a queue drained by a background listener thread, which
+    writes JSON lines to a rotating file and text lines to the in-memory store.
+    Returns (logger, listener); call listener.stop() on shutdown to flush.
+    """
+    text_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+
+    store_handler = LogStoreHandler(store)
+    store_handler.setFormatter(text_formatter)
+
+    file_handler = SizedTimedRotatingFileHandler(
+        log_path,
+        max_bytes=int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024)),
+        when=os.getenv("LOG_ROTATE_WHEN", "midnight"),
+        backupCount=int(os.getenv("LOG_BACKUP_COUNT", 7)),
+        delay=True,
+    )
+    file_handler.setFormatter(JsonFormatter())
+
+    log_queue = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", 10000)))
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    logger.handlers.clear()
+    logger.addHandler(queue_handler)
+    logger.propagate = False
+
+    listener = QueueListener(log_queue, store_handler, file_handler, respect_handler_level=True)
+    return logger, listener
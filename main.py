@@ -1,13 +1,76 @@
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import FastAPI, status
+from fastapi import FastAPI, Request, status
 from pydantic import BaseModel
-from collections import deque
-import logging
+from contextlib import asynccontextmanager
+import httpClient
+import cartTools
+import asyncio
+from productCache import product_cache
+from responseCache import response_cache
+from sharedState import shared_state
+from lexicalIndex import lexical_index
+from warmup import Warmup, save_snapshot
+from admission import admission, user_key, AdmissionRejected
+from rateLimiter import openai_limiter
+from nodeResilience import node_resilience
+import tracing
+from logPipeline import LogStore, SharedLogStore, setup_logging, bind_request, set_log_user, log_context
+import ragAgent
+import utils
 import wrapper
+import json
+import time
+import uuid
 import os
 
-app = FastAPI()
+async def refresh_periodically(name: str, refresh, interval: float, bump_catalog: bool = False, start_after: asyncio.Task = None):
+    """
+    Call refresh(products_collection) every interval seconds in a worker thread; refresh returns
+    the number of changed products. With start_after, the first interval starts once that task is done.
+    """
+    if start_after is not None: await asyncio.wait({start_after})
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            updated = await asyncio.to_thread(refresh, utils.get_products_collection())
+            if updated:
+                if bump_catalog: response_cache.bump_catalog_version()
+                logger.info(f"Refreshed {updated} products in the {name}")
+        except Exception as e:
+            logger.error(f"Error refreshing {name}: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    utils.init_clients()
+    refresh_tasks = []
+    index_interval = float(os.getenv("VECTOR_INDEX_REFRESH_SECONDS", 300))
+    # The in-process indexes load in the background warmup; until then searches use Mongo / vector-only results.
+    indexes = []
+    if os.getenv("VECTOR_SEARCH_BACKEND", "mongo") == "local": indexes.append(("vector_index", "local vector index", utils.product_index))
+    if ragAgent.get_retrieval_mode() == "hybrid": indexes.append(("lexical_index", "lexical index", lexical_index))
+    # Serve /health right away; /ready turns 200 once the background warmup is done.
+    warmup_task = asyncio.create_task(warmup.run(warmup_snapshot_path, {step: index.load for step, _, index in indexes}))
+    for _, name, index in indexes:
+        refresh_tasks.append(asyncio.create_task(refresh_periodically(name, index.refresh, index_interval, bump_catalog=True, start_after=warmup_task)))
+    cards_interval = float(os.getenv("PRODUCT_CARDS_REFRESH_SECONDS", 0))
+    if utils.product_cards.db is not None and cards_interval > 0:
+        refresh_tasks.append(asyncio.create_task(refresh_periodically("product cards", utils.product_cards.refresh, cards_interval)))
+    yield
+    warmup_task.cancel()
+    for task in refresh_tasks: task.cancel()
+    if warmup_snapshot_path:
+        try:
+            await asyncio.to_thread(save_snapshot, warmup_snapshot_path)
+        except Exception as e:
+            logger.error(f"Error saving warmup snapshot: {e}")
+    await httpClient.close_node_client()
+    await utils.close_clients()
+    if shared_state is not None: shared_state.close()
+    log_listener.stop()
+    if isinstance(log_store, SharedLogStore): log_store.close()
+
+app = FastAPI(lifespan=lifespan)
 
 origins = os.getenv("ALLOWED_ORIGINS", "").split(",")
 origins = [origin.strip() for origin in origins if origin.strip()]
@@ -20,42 +83,51 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-class LogStore:
-    def __init__(self):
-        self.logs = deque(maxlen=20)
-
-    def add_log(self, log: str):
-        self.logs.append(log)
-
-    def clear_logs(self):
-        self.logs.clear()
-    
-    def get_last_n_logs(self, n: int):
-        return list(self.logs)[-n:] if n <= len(self.logs) else list(self.logs)
-
-    def get_logs(self):
-        return list(self.logs)
-    
-log_store = LogStore()
-log_path = "./fastapi.logs"
-
-class LogStoreHandler(logging.Handler):
-    def emit(self, record):
-        log_entry = self.format(record)
-        log_store.add_log(log_entry)
+log_buffer_size = int(os.getenv("LOG_BUFFER_SIZE", 1000))
+log_store_path = os.getenv("SHARED_LOG_PATH") or (SharedLogStore.default_path(shared_state.path) if shared_state is not None else None)
+log_store = SharedLogStore(log_store_path, log_buffer_size) if log_store_path else LogStore(maxlen=log_buffer_size)
+log_path = os.getenv("LOG_PATH", "./fastapi.logs")
 
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+logger, log_listener = setup_logging("fastapi_logger", log_store, log_path)
+log_listener.start()
 
-store_handler = LogStoreHandler()
-store_handler.setFormatter(formatter)
+warmup = Warmup.from_env(logger)
+warmup_snapshot_path = os.getenv("WARMUP_SNAPSHOT_PATH")
 
-file_handler = logging.FileHandler(log_path)
-file_handler.setFormatter(formatter)
-
-logger = logging.getLogger("fastapi_logger")
-logger.setLevel(logging.INFO)
-logger.addHandler(store_handler)
-logger.addHandler(file_handler)
+@app.middleware("http")
+async def log_requests(request: Request, call_next):
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    log_token = bind_request(request_id)
+    trace_token = tracing.start_request_trace()
+    tracing.http_in_flight.inc()
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        response.headers["X-Request-ID"] = request_id
+        if request.headers.get("X-Debug-Timing") or os.getenv("DEBUG_TIMING_HEADER", "0") == "1":
+            trace = tracing.request_trace.get()
+            if trace: response.headers["Server-Timing"] = tracing.server_timing(trace)
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        tracing.http_in_flight.dec()
+        tracing.http_duration.observe(elapsed, method=request.method, path=path)
+        tracing.http_requests.inc(method=request.method, path=path, status=status_code)
+        tracing.request_trace.reset(trace_token)
+        logger.info(
+            f"{request.method} {request.url.path} {status_code}",
+            extra={
+                "method": request.method,
+                "path": request.url.path,
+                "status": status_code,
+                "latency_ms": round(elapsed * 1000, 2),
+            },
+        )
+        log_context.reset(log_token)
 
 @app.get("/")
 def home():
@@ -65,6 +137,11 @@ def home():
 def health_check():
     return {"status": "ok"}
 
+@app.get("/ready")
+def readiness_check():
+    report = warmup.report()
+    return JSONResponse(content=report, status_code=200 if report["ready"] else 503)
+
 class UserQuery(BaseModel):
     user_name: str
     user_age: int
@@ -73,8 +150,32 @@ class UserQuery(BaseModel):
     last_response_id: str = None
     use_structuring: bool = False
 
+def too_many_requests(rejection: AdmissionRejected) -> JSONResponse:
+    logger.warning(f"Rejected agent run: {rejection.reason}")
+    return JSONResponse(
+        content={"message": "Too many requests, try again later"},
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        headers={"Retry-After": str(max(1, round(rejection.retry_after)))},
+    )
+
+class ReleasingStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that calls on_close once it is done, including when the client disconnected
+    before the body iterator was ever started (its finally blocks then never run).
+    """
+    def __init__(self, content, on_close, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.on_close()
+
 @app.post("/agent_response")
 async def get_agent_response(user_query: UserQuery):
+    set_log_user(user_query.user_name)
     logger.info(f"Query on Get Agent Response")
     if not user_query.user_input or user_query.user_input.strip() == "":
         logger.error(f"Invalid user query: {user_query}")
@@ -82,25 +183,119 @@ async def get_agent_response(user_query: UserQuery):
     if not user_query.last_response_id or user_query.last_response_id.strip() == "":
         user_query.last_response_id = None
     try:
-        response = await wrapper.get_agent_response(
-            user_name=user_query.user_name,
-            user_age=user_query.user_age,
-            user_input=user_query.user_input,
-            last_response_id=user_query.last_response_id,
-            use_structuring=user_query.use_structuring,
-            user_jwt=user_query.user_jwt
-        )
+        async with admission.slot(user_key(user_query.user_name, user_query.user_jwt)):
+            response = await wrapper.get_agent_response(
+                user_name=user_query.user_name,
+                user_age=user_query.user_age,
+                user_input=user_query.user_input,
+                last_response_id=user_query.last_response_id,
+                use_structuring=user_query.use_structuring,
+                user_jwt=user_query.user_jwt
+            )
         response['message'] = "Success"
         logger.info(f"Successfully fetched agent response")
         return JSONResponse(content=response, status_code=200)
+    except AdmissionRejected as e:
+        return too_many_requests(e)
     except Exception as e:
         logger.error(f"Error fetching agent response: {e}")
         return JSONResponse(content={"message": "Could Not Fetch response try again later"}, status_code=404)
     
+@app.post("/agent_response/batch")
+async def batch_agent_response(user_queries: list[UserQuery], concurrency: int = None):
+    """
+    Run independent queries concurrently and stream one NDJSON line per query as it finishes:
+    {"index": i, "status": "ok", "response": {...}} or {"index": i, "status": "error", "message": ...}.
+    Items share the process-wide embedding and product caches.
+    """
+    max_concurrency = int(os.getenv("BATCH_MAX_CONCURRENCY", 32))
+    concurrency = max(1, min(concurrency or int(os.getenv("BATCH_CONCURRENCY", 8)), max_concurrency))
+    logger.info(f"Query on Batch Agent Response: {len(user_queries)} items, concurrency {concurrency}")
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_item(index: int, user_query: UserQuery) -> dict:
+        if not user_query.user_input or user_query.user_input.strip() == "":
+            return {"index": index, "status": "error", "message": "Invalid user query"}
+        if not user_query.last_response_id or user_query.last_response_id.strip() == "":
+            user_query.last_response_id = None
+        async with semaphore:
+            try:
+                async with admission.slot(user_key(user_query.user_name, user_query.user_jwt)):
+                    response = await wrapper.get_agent_response(
+                        user_name=user_query.user_name,
+                        user_age=user_query.user_age,
+                        user_input=user_query.user_input,
+                        last_response_id=user_query.last_response_id,
+                        use_structuring=user_query.use_structuring,
+                        user_jwt=user_query.user_jwt
+                    )
+            except AdmissionRejected as e:
+                return {"index": index, "status": "error", "message": "Too many requests, try again later", "retry_after": e.retry_after}
+            except Exception as e:
+                logger.error(f"Error fetching batch item {index} agent response: {e}")
+                return {"index": index, "status": "error", "message": "Could Not Fetch response try again later"}
+        return {"index": index, "status": "ok", "response": response}
+
+    async def lines():
+        tasks = [asyncio.create_task(run_item(index, user_query)) for index, user_query in enumerate(user_queries)]
+        failed = 0
+        try:
+            for task in asyncio.as_completed(tasks):
+                result = await task
+                failed += result["status"] != "ok"
+                yield json.dumps(result) + "\n"
+            logger.info(f"Finished batch of {len(tasks)} items, {failed} failed")
+        finally:
+            # Client went away or the stream was aborted: stop the remaining runs.
+            for task in tasks: task.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/agent_response/stream")
+async def stream_agent_response(user_query: UserQuery):
+    set_log_user(user_query.user_name)
+    logger.info(f"Query on Stream Agent Response")
+    if not user_query.user_input or user_query.user_input.strip() == "":
+        logger.error(f"Invalid user query: {user_query}")
+        return JSONResponse(content={"message": "Invalid user query"}, status_code=400)
+    if not user_query.last_response_id or user_query.last_response_id.strip() == "":
+        user_query.last_response_id = None
+    # Admit before the 200 goes out so an overloaded server can still answer 429.
+    try:
+        await admission.acquire(user_key(user_query.user_name, user_query.user_jwt))
+    except AdmissionRejected as e:
+        return too_many_requests(e)
+    release = admission.releaser()
+
+    async def events():
+        try:
+            async for event, data in wrapper.stream_agent_response(
+                user_name=user_query.user_name,
+                user_age=user_query.user_age,
+                user_input=user_query.user_input,
+                last_response_id=user_query.last_response_id,
+                use_structuring=user_query.use_structuring,
+                user_jwt=user_query.user_jwt
+            ):
+                if event == "final": data['message'] = "Success"
+                yield sse_event(event, data)
+            logger.info(f"Successfully streamed agent response")
+        except Exception as e:
+            logger.error(f"Error streaming agent response: {e}")
+            yield sse_event("error", {"message": "Could Not Fetch response try again later"})
+        finally:
+            release()
+
+    return ReleasingStreamingResponse(events(), release, media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.get("/logs")
-def get_all_logs(join: bool = False):
-    if join: return {"logs": "\n".join(log_store.get_logs())}
-    return {"logs": log_store.get_logs()}
+def get_all_logs(join: bool = False, level: str = None, since: float = None, until: float = None, structured: bool = False):
+    logs = log_store.query(level=level, since=since, until=until, structured=structured)
+    if join and not structured: return {"logs": "\n".join(logs)}
+    return {"logs": logs}
 
 @app.get("/logs/download")
 def download_log():
@@ -109,15 +304,59 @@ def download_log():
     return FileResponse(log_path, media_type='text/plain', filename="fastapi.log")
 
 @app.get("/logs/{n}")
-def get_last_n_logs(n: int, join: bool = False):
-    if join: return {"logs": "\n".join(log_store.get_last_n_logs(n))}
-    return {"logs": log_store.get_last_n_logs(n)}
+def get_last_n_logs(n: int, join: bool = False, level: str = None, since: float = None, until: float = None, structured: bool = False):
+    logs = log_store.query(n=n, level=level, since=since, until=until, structured=structured)
+    if join and not structured: return {"logs": "\n".join(logs)}
+    return {"logs": logs}
 
 @app.delete("/logs/delete")
 def clear_logs():
     log_store.clear_logs()
     return {"status": "cleared"}
 
+@app.get("/metrics")
+def get_metrics():
+    return PlainTextResponse(tracing.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    return {
+        "embeddings": utils.embedding_cache.stats(),
+        "embedding_batches": utils.embedding_batcher.stats(),
+        "vector_index": utils.product_index.stats(),
+        "embedding_profile": utils.embedding_profile.stats(),
+        "lexical_index": lexical_index.stats(),
+        "products": product_cache.stats(),
+        "carts": cartTools.cart_cache.stats(),
+        "product_cards": utils.product_cards.stats(),
+        "responses": response_cache.stats(),
+        "shared_state": shared_state.stats() if shared_state is not None else None,
+    }
+
+@app.get("/admission/stats")
+def get_admission_stats():
+    return {"admission": admission.stats(), "openai_limiter": openai_limiter.stats()}
+
+@app.get("/node/stats")
+def get_node_stats():
+    return node_resilience.stats()
+
+@app.post("/cache/catalog_version")
+async def bump_catalog_version():
+    response_cache.bump_catalog_version()
+    return {"catalog_version": response_cache.catalog_version}
+
+@app.get("/retrieval/stats")
+def get_retrieval_stats():
+    return {"mode": ragAgent.get_retrieval_mode(), "modes": ragAgent.retrieval_stats.stats()}
+
+@app.delete("/cache/products")
+async def invalidate_product_cache(endpoint: str = None, key: str = None):
+    dropped = product_cache.invalidate(endpoint, key)
+    response_cache.bump_catalog_version()
+    logger.info(f"Invalidated {dropped} product cache entries (endpoint={endpoint}, key={key})")
+    return {"status": "invalidated", "dropped": dropped}
+
 @app.get("/cors")
 def get_cors():
     return {"allowed": origins}
\ No newline at end of file
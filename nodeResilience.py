@@ -0,0 +1,176 @@
+from agents import RunContextWrapper
+from agents.tool import default_tool_error_function
+from collections import deque
+from tracing import registry, Counter
+import httpx
+import time
+import os
+
+node_hedges = registry.register(Counter("sparky_node_hedged_requests_total", "Hedged duplicate Node backend reads, by endpoint and winner.", ("endpoint", "winner")))
+node_short_circuits = registry.register(Counter("sparky_node_short_circuited_total", "Node backend calls failed fast by an open circuit breaker.", ("endpoint",)))
+
+SERVICE_NAMES = {"/app/search": "product search service", "/app/cart": "cart service"}
+
+def service_name(path: str) -> str:
+    for prefix, name in SERVICE_NAMES.items():
+        if path.startswith(prefix): return name
+    return "store backend"
+
+class BackendUnavailable(Exception):
+    """
+    Raised instead of calling the Node backend while its circuit breaker is open.
+    The message is written for the model, see node_tool_error.
+    """
+    def __init__(self, path: str, retry_after: float):
+        self.path = path
+        self.retry_after = retry_after
+        super().__init__(
+            f"The {service_name(path)} is temporarily unavailable (retry in about {max(1, round(retry_after))} seconds). "
+            "Do not call this tool again right now; answer with the information you already have or tell the user to try again shortly."
+        )
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures and fails fast for cooldown seconds,
+    then lets one trial call through (half-open); its success closes the breaker again.
+    """
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None: return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def retry_after(self) -> float:
+        if self.opened_at is None: return 0.0
+        return max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed": return True
+        if state == "half_open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.trial_in_flight or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self.trial_in_flight = False
+
+class EndpointStats:
+    """
+    Latency window, counters and circuit breaker of one Node endpoint (method plus path prefix).
+    """
+    def __init__(self, window: int = 200, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.latencies = deque(maxlen=window)
+        self.breaker = CircuitBreaker(failure_threshold, cooldown)
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.short_circuited = 0
+
+    def record(self, elapsed: float, ok: bool, timeout: bool = False):
+        self.requests += 1
+        if ok:
+            self.latencies.append(elapsed)
+            self.breaker.record_success()
+        else:
+            self.errors += 1
+            self.timeouts += int(timeout)
+            self.breaker.record_failure()
+
+    def percentile(self, q: float):
+        if not self.latencies: return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def stats(self) -> dict:
+        p50, p95, p99 = (self.percentile(q) for q in (0.5, 0.95, 0.99))
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "short_circuited": self.short_circuited,
+            "p50_ms": p50 and p50 * 1000,
+            "p95_ms": p95 and p95 * 1000,
+            "p99_ms": p99 and p99 * 1000,
+            "breaker": self.breaker.state,
+        }
+
+class NodeResilience:
+    """
+    Per-endpoint timeouts, hedging policy and circuit breakers for the Node backend.
+    """
+    def __init__(self, search_timeout: float = 5.0, cart_timeout: float = 10.0, hedge_enabled: bool = True, hedge_min_delay: float = 0.05, hedge_min_samples: int = 20, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.timeouts = {"/app/search": search_timeout, "/app/cart": cart_timeout}
+        self.hedge_enabled = hedge_enabled
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.endpoints = {}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            search_timeout=float(os.getenv("NODE_SEARCH_TIMEOUT", 5)),
+            cart_timeout=float(os.getenv("NODE_CART_TIMEOUT", 10)),
+            hedge_enabled=os.getenv("NODE_HEDGE_ENABLED", "1") == "1",
+            hedge_min_delay=float(os.getenv("NODE_HEDGE_MIN_DELAY", 0.05)),
+            hedge_min_samples=int(os.getenv("NODE_HEDGE_MIN_SAMPLES", 20)),
+            failure_threshold=int(os.getenv("NODE_BREAKER_FAILURES", 5)),
+            cooldown=float(os.getenv("NODE_BREAKER_COOLDOWN", 30)),
+        )
+
+    def endpoint(self, label: str) -> EndpointStats:
+        endpoint = self.endpoints.get(label)
+        if endpoint is None:
+            endpoint = self.endpoints[label] = EndpointStats(failure_threshold=self.failure_threshold, cooldown=self.cooldown)
+        return endpoint
+
+    def timeout_for(self, path: str):
+        for prefix, timeout in self.timeouts.items():
+            if path.startswith(prefix): return timeout
+        return None
+
+    def hedge_delay(self, method: str, path: str, endpoint: EndpointStats, timeout: float):
+        """
+        Seconds to wait before sending a duplicate read, or None when the call must not be hedged.
+        Only idempotent search reads are hedged, after the endpoint's recent p95 latency.
+        """
+        if not self.hedge_enabled or method != "GET" or not path.startswith("/app/search/"): return None
+        if len(endpoint.latencies) < self.hedge_min_samples: return None
+        delay = max(self.hedge_min_delay, endpoint.percentile(0.95))
+        return delay if timeout is None or delay < timeout / 2 else None
+
+    def stats(self) -> dict:
+        return {label: endpoint.stats() for label, endpoint in sorted(self.endpoints.items())}
+
+def node_tool_error(context: RunContextWrapper, error: Exception) -> str:
+    """
+    failure_error_function for Node backend tools: tells the model what happened in words it can act on.
+    """
+    if isinstance(error, BackendUnavailable): return str(error)
+    if isinstance(error, httpx.TimeoutException):
+        return "The store backend did not answer in time. Do not retry this tool right away; tell the user the request could not be completed and to try again shortly."
+    if isinstance(error, httpx.HTTPError):
+        return "The store backend could not be reached. Do not retry this tool right away; tell the user the request could not be completed and to try again shortly."
+    return default_tool_error_function(context, error)
+
+node_resilience = NodeResilience.from_env()
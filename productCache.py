@@ -0,0 +1,185 @@
+from collections import OrderedDict
+from sharedState import shared_state
+import asyncio
+import json
+import time
+import os
+
+_MISSING = object()
+
+def estimate_size(value) -> int:
+    return len(json.dumps(value, default=str))
+
+class ProductCache:
+    """
+    Read-through cache for Node backend product and search lookups.
+    Entries are namespaced by endpoint, each with its own TTL, and evicted LRU once the
+    estimated payload size exceeds max_bytes. Concurrent misses for the same key share a
+    single backend request (single-flight).
+    With a SharedState, misses fall through to the entries other workers stored, and invalidations
+    are published to (and received from) the other workers under the cache's namespace.
+    """
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, ttls: dict = None, default_ttl: float = 60, shared=None, namespace: str = "products"):
+        self.max_bytes = max_bytes
+        self.ttls = ttls or {}
+        self.default_ttl = default_ttl
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.in_flight = {}
+        self.tasks = set()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.shared_hits = 0
+        self.store_errors = 0
+        self.shared = shared
+        self.namespace = namespace
+        if shared is not None: shared.subscribe(namespace, self._invalidate_local)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_bytes=int(os.getenv("PRODUCT_CACHE_MAX_BYTES", 32 * 1024 * 1024)),
+            ttls={
+                "id": float(os.getenv("PRODUCT_CACHE_TTL_ID", 300)),
+                "category": float(os.getenv("PRODUCT_CACHE_TTL_CATEGORY", 120)),
+                "fuzzy": float(os.getenv("PRODUCT_CACHE_TTL_FUZZY", 60)),
+            },
+            shared=shared_state,
+        )
+
+    def _drop(self, cache_key):
+        _, _, size = self.entries.pop(cache_key)
+        self.bytes -= size
+
+    def get(self, endpoint: str, key, default=None):
+        if self.shared is not None: self.shared.poll()
+        cache_key = (endpoint, key)
+        entry = self.entries.get(cache_key)
+        if entry is None: return self._get_shared(endpoint, key, default)
+        value, expires, _ = entry
+        if time.monotonic() > expires:
+            self._drop(cache_key)
+            return self._get_shared(endpoint, key, default)
+        self.entries.move_to_end(cache_key)
+        return value
+
+    def _get_shared(self, endpoint: str, key, default):
+        if self.shared is None: return default
+        entry = self.shared.get(self.namespace, endpoint, str(key))
+        if entry is None: return default
+        value, expires = entry
+        self.shared_hits += 1
+        self._store(endpoint, key, value, time.monotonic() + expires - time.time())
+        return value
+
+    def set(self, endpoint: str, key, value, size: int = None):
+        ttl = self.ttls.get(endpoint, self.default_ttl)
+        self._store(endpoint, key, value, time.monotonic() + ttl, size)
+        if self.shared is not None: self.shared.set(self.namespace, endpoint, str(key), value, ttl)
+
+    def _store(self, endpoint: str, key, value, expires: float, size: int = None):
+        cache_key = (endpoint, key)
+        if cache_key in self.entries: self._drop(cache_key)
+        size = estimate_size(value) if size is None else size
+        if size > self.max_bytes: return
+        self.entries[cache_key] = (value, expires, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            oldest = next(iter(self.entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    async def get_or_fetch(self, endpoint: str, key, fetch, cacheable=None):
+        """
+        Return the cached value for (endpoint, key), otherwise await fetch() once for all concurrent callers.
+        Args:
+            fetch: Zero-argument coroutine function producing the value.
+            cacheable (callable, optional): Predicate deciding whether a fetched value is stored.
+        """
+        value = self.get(endpoint, key, _MISSING)
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+
+        cache_key = (endpoint, key)
+        future = self.in_flight.get(cache_key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        self.misses += 1
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.in_flight[cache_key] = future
+        # The fetch runs in its own task so that cancelling the caller that started it does not
+        # cancel the other callers waiting on the same key.
+        task = loop.create_task(self._fetch(endpoint, key, fetch, cacheable, future, self.generation))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return await asyncio.shield(future)
+
+    async def _fetch(self, endpoint: str, key, fetch, cacheable, future: asyncio.Future, generation: int):
+        value, error = _MISSING, None
+        try:
+            value = await fetch()
+        except BaseException as e:
+            error = e
+        finally:
+            self.in_flight.pop((endpoint, key), None)
+            if not future.done():
+                if error is None:
+                    future.set_result(value)
+                elif isinstance(error, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(error)
+                    # Mark the exception retrieved; waiters (if any) still receive it.
+                    future.exception()
+        if isinstance(error, asyncio.CancelledError): raise error
+        if error is not None: return
+        # Skip storing values fetched across an invalidation, they may already be stale.
+        try:
+            if generation == self.generation and (cacheable is None or cacheable(value)):
+                self.set(endpoint, key, value)
+        except Exception:
+            # Caching is best effort, the callers already have their value.
+            self.store_errors += 1
+
+    def invalidate(self, endpoint: str = None, key=None) -> int:
+        """
+        Drop cached entries. With no arguments everything is dropped, with only endpoint
+        every entry of that endpoint, otherwise the single (endpoint, key) entry.
+        """
+        if self.shared is not None: self.shared.publish(self.namespace, endpoint, None if key is None else str(key))
+        return self._invalidate_local(endpoint, key)
+
+    def _invalidate_local(self, endpoint: str = None, key=None) -> int:
+        self.generation += 1
+        if endpoint is None:
+            dropped = len(self.entries)
+            self.entries.clear()
+            self.bytes = 0
+            return dropped
+        keys = [cache_key for cache_key in self.entries if cache_key[0] == endpoint and (key is None or str(cache_key[1]) == str(key))]
+        for cache_key in keys: self._drop(cache_key)
+        return len(keys)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            "shared_hits": self.shared_hits,
+            "store_errors": self.store_errors,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+product_cache = ProductCache.from_env()
@@ -0,0 +1,175 @@
+"""
+Compact product cards: a short, token-budgeted summary per product that search tools put into the
+model context instead of the full embedding_text.
+
+Cards are precomputed from the products collection into a local SQLite file and refreshed
+incrementally by the updatedAt field; products without a stored card get one built on the fly.
+
+    uv run python -m productCards            # refresh changed products
+    uv run python -m productCards --full     # rebuild every card
+"""
+from datetime import datetime
+import threading
+import argparse
+import sqlite3
+import time
+import re
+import os
+
+CARD_FIELDS = ("name", "brand", "category", "price", "rating")
+# "Key: value" pairs as found in embedding_text, e.g. "Name: Red shoes, Price: $25.00"
+TEXT_FIELD = re.compile(r"(?:^|[,\n])\s*([A-Za-z][A-Za-z ]{0,20}?)\s*:\s*([^,\n]+)")
+
+def compact_product(text: str, max_chars: int) -> str:
+    text = " ".join((text or "").split())
+    return text if len(text) <= max_chars else text[:max_chars].rsplit(" ", 1)[0] + "..."
+
+def make_card(product: dict, max_chars: int = 200) -> str:
+    """
+    Build a card from the product's name/brand/category/price/rating, taken from the document
+    fields when present and otherwise parsed from embedding_text. Falls back to the shortened text.
+    """
+    fields = {key.strip().lower(): value.strip() for key, value in TEXT_FIELD.findall(product.get("embedding_text") or "")}
+    for field in CARD_FIELDS:
+        if product.get(field) not in (None, ""): fields[field] = str(product[field])
+    if not fields.get("name"):
+        return compact_product(product.get("embedding_text", ""), max_chars)
+
+    price = fields.get("price")
+    if price and not price.startswith("$"):
+        try: price = f"${float(price):.2f}"
+        except ValueError: pass
+    parts = [fields["name"], fields.get("brand"), fields.get("category"), price, fields.get("rating") and f"{fields['rating']}/5"]
+    return compact_product(" | ".join(part for part in parts if part), max_chars)
+
+def encode_updated(value) -> str:
+    return "dt:" + value.isoformat() if isinstance(value, datetime) else repr(value)
+
+def decode_updated(value: str):
+    if value is None: return None
+    if value.startswith("dt:"): return datetime.fromisoformat(value[3:])
+    try:
+        return float(value)
+    except ValueError:
+        return value.strip("'\"")
+
+class ProductCardStore:
+    """
+    Product id -> card text, persisted in SQLite when a path is configured.
+    Lookups for products without a stored card build one from the product at hand.
+    """
+    def __init__(self, path: str = None, max_tokens: int = 48, updated_field: str = "updatedAt"):
+        self.path = path
+        self.max_chars = max_tokens * 4
+        self.updated_field = updated_field
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.db = None
+        if path: self._open_db(path)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            path=os.getenv("PRODUCT_CARDS_PATH") or None,
+            max_tokens=int(os.getenv("PRODUCT_CARD_MAX_TOKENS", 48)),
+            updated_field=os.getenv("VECTOR_INDEX_UPDATED_FIELD", "updatedAt"),
+        )
+
+    def _open_db(self, path: str):
+        self.db = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS cards (product_id TEXT PRIMARY KEY, card TEXT NOT NULL, created REAL NOT NULL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.db.commit()
+
+    def get_many(self, product_ids: list) -> dict:
+        if self.db is None or not product_ids: return {}
+        keys = [str(product_id) for product_id in product_ids]
+        with self.lock:
+            rows = self.db.execute(f"SELECT product_id, card FROM cards WHERE product_id IN ({','.join('?' * len(keys))})", keys).fetchall()
+        return dict(rows)
+
+    def cards(self, products: list) -> list:
+        """
+        Cards for product dicts (with _id and embedding_text), in the same order.
+        """
+        stored = self.get_many([product.get("_id") for product in products])
+        result = []
+        for product in products:
+            card = stored.get(str(product.get("_id")))
+            if card is None:
+                self.misses += 1
+                card = make_card(product, self.max_chars)
+            else:
+                self.hits += 1
+            result.append(card)
+        return result
+
+    def put_many(self, rows: list):
+        now = time.time()
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO cards (product_id, card, created) VALUES (?, ?, ?)", [(str(product_id), card, now) for product_id, card in rows])
+            self.db.commit()
+
+    def _meta(self, key: str, value: str = None):
+        with self.lock:
+            if value is None:
+                row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+                return row[0] if row else None
+            self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+            self.db.commit()
+
+    def refresh(self, collection, full: bool = False, batch_size: int = 1000) -> int:
+        """
+        (Re)build cards for products changed since the last refresh, or for every product with full=True.
+        Returns the number of cards written.
+        """
+        if self.db is None: raise ValueError("PRODUCT_CARDS_PATH is not set.")
+        last_updated = None if full else decode_updated(self._meta("last_updated"))
+        query = {self.updated_field: {"$gt": last_updated}} if last_updated is not None and self.updated_field else {}
+        projection = {"embedding_text": 1, **{field: 1 for field in CARD_FIELDS}}
+        if self.updated_field: projection[self.updated_field] = 1
+
+        written, batch = 0, []
+        for product in collection.find(query, projection, batch_size=batch_size):
+            batch.append((product["_id"], make_card(product, self.max_chars)))
+            updated = product.get(self.updated_field) if self.updated_field else None
+            if updated is not None and (last_updated is None or updated > last_updated): last_updated = updated
+            if len(batch) >= batch_size:
+                self.put_many(batch)
+                written += len(batch)
+                batch = []
+        if batch:
+            self.put_many(batch)
+            written += len(batch)
+        if last_updated is not None: self._meta("last_updated", encode_updated(last_updated))
+        return written
+
+    def stats(self) -> dict:
+        stored = 0
+        if self.db is not None:
+            with self.lock: stored = self.db.execute("SELECT COUNT(*) FROM cards").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "stored": stored,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "max_chars": self.max_chars,
+        }
+
+product_cards = ProductCardStore.from_env()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--full", action="store_true", help="rebuild every card instead of only changed products")
+    args = parser.parse_args()
+
+    import utils
+    start = time.perf_counter()
+    written = product_cards.refresh(utils.get_products_collection(), full=args.full)
+    print(f"Wrote {written} product cards to {product_cards.path} in {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
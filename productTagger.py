@@ -0,0 +1,51 @@
+from functools import lru_cache
+import re
+
+# Numbers explicitly labelled as ids by the model, e.g. "ID: 123", "Product ID #123".
+LABELLED_ID = re.compile(r"\b(?:product\s*)?id\b\s*[:#=-]?\s*(\d+)\b(?!\s*</id>)", re.IGNORECASE)
+
+@lru_cache(maxsize=256)
+def build_matcher(product_ids: frozenset):
+    """
+    Compile a matcher for standalone occurrences of the given ids, used to find bare mentions.
+    Digits that are part of prices, decimals, longer numbers or existing <id></id> tags are not matched.
+    """
+    alternation = "|".join(sorted(product_ids, key=len, reverse=True))
+    return re.compile(rf"(?<![\w$.,<>/-])({alternation})(?![\w%]|[.,]\d|\s*</id>)")
+
+def tag_product_ids(text: str, product_ids) -> tuple:
+    """
+    Wrap known product ids written in an id context ("ID: 123") with <id></id> tags.
+    A known id appearing as a bare number could just as well be a count, size or list number,
+    so it is left alone and reported as ambiguous, like labelled ids no tool returned.
+    Args:
+        text (str): Final markdown response of the agent.
+        product_ids: Ids returned by tools during the run.
+    Returns:
+        tuple: (tagged text, ambiguous ids: labelled but unknown, or known but bare)
+
+    >>> tag_product_ids("**Nike Air** (ID: 12) and Product ID #3", {3, 12})
+    ('**Nike Air** (ID: <id>12</id>) and Product ID #<id>3</id>', [])
+    >>> tag_product_ids("Here are 3 great picks: 1. **Nike Air** (ID: 12)", {1, 3, 12})
+    ('Here are 3 great picks: 1. **Nike Air** (ID: <id>12</id>)', ['3', '1'])
+    >>> tag_product_ids("Available in size 10, rated 2/5. Buy 2 get 1 free! Would you like 2 of them?", {1, 2, 10})
+    ('Available in size 10, rated 2/5. Buy 2 get 1 free! Would you like 2 of them?', ['10', '2', '1'])
+    >>> tag_product_ids("It costs $12.50 for 1.5 kg (ID: 99)", {1, 12})
+    ('It costs $12.50 for 1.5 kg (ID: 99)', ['99'])
+    """
+    if not text: return text, []
+    known = frozenset(str(product_id) for product_id in product_ids if str(product_id).isdigit())
+    ambiguous = []
+
+    def tag(match):
+        if match.group(1) not in known:
+            ambiguous.append(match.group(1))
+            return match.group(0)
+        return match.group(0)[:match.start(1) - match.start(0)] + f"<id>{match.group(1)}</id>"
+
+    text = LABELLED_ID.sub(tag, text)
+    if known: ambiguous += build_matcher(known).findall(text)
+    return text, list(dict.fromkeys(ambiguous))
+
+def tag_labelled_ids(text: str) -> str:
+    return LABELLED_ID.sub(lambda match: match.group(0)[:match.start(1) - match.start(0)] + f"<id>{match.group(1)}</id>", text)
@@ -1,7 +1,69 @@
 from agents import Agent, RunContextWrapper, Runner, function_tool, set_default_openai_key
+from lexicalIndex import lexical_index, reciprocal_rank_fusion
 import pydantic
 import utils
 import asyncio
+import time
+import re
+import os
+
+RETRIEVAL_MODES = ("agent", "direct", "hybrid")
+
+# Follow-up queries that only make sense with the conversation, e.g. "cheaper ones", "something like that".
+CONTEXTUAL_QUERY = re.compile(
+    r"\b(it|its|this|that|these|those|them|they|one|ones|same|similar|another|other|else|more|cheaper|bigger|smaller|instead|above|previous|last)\b",
+    re.IGNORECASE,
+)
+
+def get_retrieval_mode() -> str:
+    mode = os.getenv("RETRIEVAL_MODE", "agent")
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"RETRIEVAL_MODE must be one of {RETRIEVAL_MODES}, got {mode!r}.")
+    return mode
+
+class RetrievalStats:
+    """
+    Per-mode latency and LLM token usage of product retrieval tool calls.
+    Fallbacks count calls answered from a degraded path, e.g. hybrid search without its vector results.
+    """
+    def __init__(self):
+        self.modes = {mode: {"calls": 0, "errors": 0, "fallbacks": 0, "total_ms": 0.0, "max_ms": 0.0, "input_tokens": 0, "output_tokens": 0, "llm_requests": 0} for mode in RETRIEVAL_MODES}
+
+    def record(self, mode: str, elapsed_ms: float, input_tokens: int = 0, output_tokens: int = 0, llm_requests: int = 0, error: bool = False, fallback: bool = False):
+        stats = self.modes[mode]
+        stats["calls"] += 1
+        stats["errors"] += int(error)
+        stats["fallbacks"] += int(fallback)
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+        stats["input_tokens"] += input_tokens
+        stats["output_tokens"] += output_tokens
+        stats["llm_requests"] += llm_requests
+
+    def stats(self) -> dict:
+        report = {}
+        for mode, stats in self.modes.items():
+            calls = stats["calls"] or 1
+            report[mode] = {
+                **stats,
+                "avg_ms": stats["total_ms"] / calls,
+                "avg_tokens": (stats["input_tokens"] + stats["output_tokens"]) / calls,
+            }
+        return report
+
+retrieval_stats = RetrievalStats()
+
+rag_agent = Agent(
+        name="rag_agent",
+        instructions="""
+                    You are a Vector Store Retrieval Agent. 
+                    You will be given a raw user querry and you have to build a full querry with conversation context and the user query. 
+                    Your job is to retrieve and filter relevant products from the vector store effectively.
+                    The Output should be strictly from the retrived products and you must strictly include retrieved product ids and all product details in your response.
+        """,
+        model="gpt-4.1",
+        tools=[utils.retrieve_products],
+)
 
 @function_tool
 async def vector_store_retriever_agent(context_wrapper: RunContextWrapper[utils.User], query: str) -> str:
@@ -19,19 +81,130 @@ async def vector_store_retriever_agent(context_wrapper: RunContextWrapper[utils.
     """
     last_response_id = context_wrapper.context.last_response_id
 
-    agent = Agent(
-            name="rag_agent",
-            instructions="""
-                        You are a Vector Store Retrieval Agent. 
-                        You will be given a raw user querry and you have to build a full querry with conversation context and the user query. 
-                        Your job is to retrieve and filter relevant products from the vector store effectively.
-                        The Output should be strictly from the retrived products and you must strictly include retrieved product ids and all product details in your response.
-            """,
-            model="gpt-4.1",
-            tools=[utils.retrieve_products],
+    start = time.perf_counter()
+    try:
+        result = await Runner.run(rag_agent, query, previous_response_id=last_response_id, context=context_wrapper.context)
+    except Exception:
+        retrieval_stats.record("agent", (time.perf_counter() - start) * 1000, error=True)
+        raise
+    usage = result.context_wrapper.usage
+    retrieval_stats.record("agent", (time.perf_counter() - start) * 1000, usage.input_tokens, usage.output_tokens, usage.requests)
+
+    return result.final_output
+
+async def rewrite_query(query: str, last_response_id: str):
+    """
+    Turn a follow-up into a standalone product search query using the conversation so far.
+    Returns (query, response usage or None).
+    """
+    client = utils.get_async_openai_client()
+    response = await client.responses.create(
+        model=os.getenv("RETRIEVAL_REWRITE_MODEL", "gpt-4.1-mini"),
+        previous_response_id=last_response_id,
+        store=False,
+        instructions="Rewrite the user's latest request as one standalone product search query using the conversation so far. Reply with the query only.",
+        input=query,
+    )
+    return (response.output_text.strip() or query), response.usage
+
+@function_tool
+async def direct_product_retriever(context_wrapper: RunContextWrapper[utils.User], query: str, limit: int = 8, details: bool = False) -> str:
+    """
+    Retrieve relevant Products from the vector database for a product search query.
+    Use this especially when the user query is very specific and describes what they are looking for.
+
+    Args:
+        query (str): The product search query, include relevant details from the conversation.
+        limit (int): The number of products to return. Default is 8.
+        details (bool): Return full product details instead of short product cards. Default is False.
+
+    Returns:
+        str: Product ids with short product cards and match scores.
+    """
+    last_response_id = context_wrapper.context.last_response_id
+
+    start = time.perf_counter()
+    usage = None
+    try:
+        if last_response_id and CONTEXTUAL_QUERY.search(query):
+            query, usage = await rewrite_query(query, last_response_id)
+        results = await utils.search_products(query, limit)
+    except Exception:
+        retrieval_stats.record("direct", (time.perf_counter() - start) * 1000, error=True)
+        raise
+    retrieval_stats.record(
+        "direct", (time.perf_counter() - start) * 1000,
+        getattr(usage, "input_tokens", 0), getattr(usage, "output_tokens", 0), int(usage is not None),
+    )
+    utils.record_product_ids(context_wrapper, (result['_id'] for result in results))
+
+    if not results: return f"No products found for: {query}"
+    lines = [f"Products for: {query}"]
+    cards = [result['embedding_text'] for result in results] if details else utils.product_cards.cards(results)
+    for result, card in zip(results, cards):
+        lines.append(f"ID: {result['_id']} (score {result['score']:.3f}): {card}")
+    return "\n".join(lines)
 
+@function_tool
+async def hybrid_search(context_wrapper: RunContextWrapper[utils.User], query: str, category: str = None, k: int = 10, details: bool = False) -> str:
+    """
+    Search the product catalog by keywords and by meaning at once. Use this for any product search,
+    from exact names or brands to loose descriptions of what the user wants.
+
+    Args:
+        query (str): The product search query, include relevant details from the conversation.
+        category (str, optional): Only return products of this category, e.g. "Electronics".
+        k (int): The number of products to return. Default is 10.
+        details (bool): Return full product details instead of short product cards. Default is False.
+
+    Returns:
+        str: Product ids with short product cards.
+    """
+    last_response_id = context_wrapper.context.last_response_id
+    candidates = max(k * 4, int(os.getenv("HYBRID_CANDIDATES", 40)))
+
+    start = time.perf_counter()
+    usage = None
+    try:
+        if last_response_id and CONTEXTUAL_QUERY.search(query):
+            query, usage = await rewrite_query(query, last_response_id)
+        lexical = lexical_index.search(query, candidates, category)
+    except Exception:
+        retrieval_stats.record("hybrid", (time.perf_counter() - start) * 1000, error=True)
+        raise
+    fallback = False
+    try:
+        vector = await utils.search_products(query, candidates)
+    except Exception:
+        # Embedding or vector search failed: answer from the keyword results alone when there are any.
+        if not lexical_index.ready:
+            retrieval_stats.record("hybrid", (time.perf_counter() - start) * 1000, error=True)
+            raise
+        vector, fallback = [], True
+    if category and lexical_index.ready:
+        vector = [result for result in vector if (lexical_index.category_of(result['_id']) or "").casefold() == category.casefold()]
+    fused = reciprocal_rank_fusion(
+        [[product_id for product_id, _, _ in lexical], [result['_id'] for result in vector]],
+        int(os.getenv("HYBRID_RRF_K", 60)),
+    )[:k]
+    retrieval_stats.record(
+        "hybrid", (time.perf_counter() - start) * 1000,
+        getattr(usage, "input_tokens", 0), getattr(usage, "output_tokens", 0), int(usage is not None), fallback=fallback,
     )
 
-    result = await Runner.run(agent, query, previous_response_id=last_response_id)
+    texts = {product_id: text for product_id, text, _ in lexical}
+    texts.update((result['_id'], result['embedding_text']) for result in vector)
+    products = [{"_id": product_id, "embedding_text": texts[product_id]} for product_id, _ in fused]
+    utils.record_product_ids(context_wrapper, (product["_id"] for product in products))
+
+    if not products: return f"No products found for: {query}"
+    lines = [f"Products for: {query}"]
+    cards = [product['embedding_text'] for product in products] if details else utils.product_cards.cards(products)
+    for product, card in zip(products, cards):
+        lines.append(f"ID: {product['_id']}: {card}")
+    return "\n".join(lines)
+
+RETRIEVAL_TOOLS = {"agent": vector_store_retriever_agent, "direct": direct_product_retriever, "hybrid": hybrid_search}
 
-    return result.final_output
\ No newline at end of file
+def get_retrieval_tool(mode: str = None):
+    return RETRIEVAL_TOOLS[mode or get_retrieval_mode()]
\ No newline at end of file
@@ -0,0 +1,200 @@
+from tracing import registry, Counter, Histogram
+import threading
+import asyncio
+import random
+import json
+import time
+import re
+import os
+
+limiter_wait = registry.register(Histogram("sparky_openai_limiter_wait_seconds", "Time OpenAI calls waited in the shared rate limiter.", buckets=(0.001, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)))
+limiter_throttled = registry.register(Counter("sparky_openai_rate_limited_total", "OpenAI responses with status 429, by model.", ("model",)))
+
+RESET_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+RESET_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+def parse_reset(value: str) -> float:
+    """
+    Parse OpenAI reset durations such as "20ms", "1s", "6m0s" into seconds.
+    """
+    if not value: return 0.0
+    try:
+        return float(value)
+    except ValueError:
+        return sum(float(amount) * RESET_UNITS[unit] for amount, unit in RESET_PART.findall(value))
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at rate_per_minute. Reservations may drive the bucket
+    negative; the caller then waits until its share has been refilled, which keeps callers FIFO.
+    """
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        self._refill(now)
+        self.tokens -= amount
+        return max(0.0, -self.tokens / self.rate) if self.rate > 0 else 0.0
+
+    def set_rate(self, rate_per_minute: float, now: float):
+        self._refill(now)
+        self.rate = rate_per_minute / 60
+        self.capacity = rate_per_minute
+        self.tokens = min(self.tokens, self.capacity)
+
+    def drain(self, remaining: float, now: float):
+        # The server knows better how much is left, e.g. when other processes share the key.
+        self._refill(now)
+        self.tokens = min(self.tokens, remaining)
+
+class ModelBudget:
+    """
+    Request and token buckets of one model, plus its 429 backoff state.
+    """
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.blocked_until = 0.0
+        self.consecutive_throttles = 0
+
+class OpenAIRateLimiter:
+    """
+    Request- and token-per-minute limiter for every OpenAI call in the process (agents, embeddings,
+    structuring). OpenAI enforces and reports limits per model, so each model gets its own budget,
+    starting from requests_per_minute / tokens_per_minute. Budgets adapt to the x-ratelimit-*
+    response headers, and a 429 pauses that model's callers for retry-after (or an exponential
+    backoff) with jitter.
+    """
+    def __init__(self, requests_per_minute: float = 3000, tokens_per_minute: float = 1_000_000, output_tokens_estimate: int = 500, max_backoff: float = 30.0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.output_tokens_estimate = output_tokens_estimate
+        self.max_backoff = max_backoff
+        self.budgets = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            requests_per_minute=float(os.getenv("OPENAI_RPM", 3000)),
+            tokens_per_minute=float(os.getenv("OPENAI_TPM", 1_000_000)),
+            output_tokens_estimate=int(os.getenv("OPENAI_OUTPUT_TOKENS_ESTIMATE", 500)),
+            max_backoff=float(os.getenv("OPENAI_MAX_BACKOFF", 30)),
+        )
+
+    def budget(self, model: str) -> ModelBudget:
+        # Called with the lock held.
+        budget = self.budgets.get(model)
+        if budget is None: budget = self.budgets[model] = ModelBudget(self.requests_per_minute, self.tokens_per_minute)
+        return budget
+
+    def request_body(self, request) -> bytes:
+        try:
+            return request.content
+        except Exception:
+            # Streaming bodies are not read yet.
+            return b""
+
+    def model_of(self, request) -> str:
+        body = self.request_body(request)
+        if body:
+            try:
+                model = json.loads(body).get("model")
+                if model: return str(model)
+            except (ValueError, AttributeError):
+                pass
+        # Without a model in the body, fall back to the endpoint, e.g. "/v1/embeddings".
+        return request.url.path
+
+    def estimate_tokens(self, request) -> int:
+        # Without a body only the expected output is counted.
+        return len(self.request_body(request)) // 4 + self.output_tokens_estimate
+
+    def reserve(self, tokens: int, model: str = "default") -> float:
+        now = time.monotonic()
+        with self.lock:
+            budget = self.budget(model)
+            wait = max(budget.requests.reserve(1, now), budget.tokens.reserve(tokens, now), budget.blocked_until - now)
+        # Jitter so callers released together do not hit the API in one burst.
+        return wait * random.uniform(1.0, 1.2) if wait > 0 else 0.0
+
+    async def acquire_async(self, tokens: int, model: str = "default"):
+        wait = self.reserve(tokens, model)
+        limiter_wait.observe(wait)
+        if wait > 0: await asyncio.sleep(wait)
+
+    def acquire(self, tokens: int, model: str = "default"):
+        wait = self.reserve(tokens, model)
+        limiter_wait.observe(wait)
+        if wait > 0: time.sleep(wait)
+
+    def observe(self, status_code: int, headers, model: str = "default"):
+        now = time.monotonic()
+        with self.lock:
+            budget = self.budget(model)
+            limit_requests = headers.get("x-ratelimit-limit-requests")
+            limit_tokens = headers.get("x-ratelimit-limit-tokens")
+            remaining_requests = headers.get("x-ratelimit-remaining-requests")
+            remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+            if limit_requests: budget.requests.set_rate(float(limit_requests), now)
+            if limit_tokens: budget.tokens.set_rate(float(limit_tokens), now)
+            if remaining_requests is not None: budget.requests.drain(float(remaining_requests), now)
+            if remaining_tokens is not None: budget.tokens.drain(float(remaining_tokens), now)
+            if remaining_requests == "0":
+                budget.blocked_until = max(budget.blocked_until, now + parse_reset(headers.get("x-ratelimit-reset-requests")))
+
+            if status_code == 429:
+                limiter_throttled.inc(model=model)
+                budget.consecutive_throttles += 1
+                retry_after_ms = headers.get("retry-after-ms")
+                retry_after = float(retry_after_ms) / 1000 if retry_after_ms else parse_reset(headers.get("retry-after"))
+                backoff = min(self.max_backoff, retry_after or 0.5 * 2 ** (budget.consecutive_throttles - 1))
+                budget.blocked_until = max(budget.blocked_until, now + backoff * random.uniform(0.5, 1.5))
+            elif status_code < 400:
+                budget.consecutive_throttles = 0
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self.lock:
+            return {
+                model: {
+                    "requests_per_minute": budget.requests.rate * 60,
+                    "tokens_per_minute": budget.tokens.rate * 60,
+                    "blocked_for": max(0.0, budget.blocked_until - now),
+                    "consecutive_throttles": budget.consecutive_throttles,
+                }
+                for model, budget in sorted(self.budgets.items())
+            }
+
+def event_hooks(limiter: OpenAIRateLimiter) -> dict:
+    """
+    httpx event hooks that make a sync client wait for the limiter and feed it the response headers.
+    The request's model travels to the response hook in request.extensions.
+    """
+    def on_request(request):
+        model = request.extensions["rate_limit_model"] = limiter.model_of(request)
+        limiter.acquire(limiter.estimate_tokens(request), model)
+
+    def on_response(response):
+        limiter.observe(response.status_code, response.headers, response.request.extensions.get("rate_limit_model", "default"))
+
+    return {"request": [on_request], "response": [on_response]}
+
+def async_event_hooks(limiter: OpenAIRateLimiter) -> dict:
+    async def on_request(request):
+        model = request.extensions["rate_limit_model"] = limiter.model_of(request)
+        await limiter.acquire_async(limiter.estimate_tokens(request), model)
+
+    async def on_response(response):
+        limiter.observe(response.status_code, response.headers, response.request.extensions.get("rate_limit_model", "default"))
+
+    return {"request": [on_request], "response": [on_response]}
+
+openai_limiter = OpenAIRateLimiter.from_env()
@@ -0,0 +1,124 @@
+from sharedState import shared_state
+import numpy as np
+import time
+import os
+
+def normalize_query(text: str) -> str:
+    return " ".join(text.split()).casefold()
+
+class SemanticResponseCache:
+    """
+    Cache of agent responses for stateless first-turn queries, looked up by embedding similarity.
+    Query embeddings live in a fixed-size, L2-normalized float32 ring buffer; a lookup is one
+    vectorized dot product over the live entries of the same variant (use_structuring, retrieval mode).
+    Entries expire after ttl seconds or when the catalog version moves on; with a SharedState,
+    a catalog version bump in any worker moves it on in all of them.
+    """
+    def __init__(self, threshold: float = 0.97, ttl: float = 600, max_entries: int = 2000, shared=None):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.matrix = None
+        self.responses = [None] * max_entries
+        self.variants = np.full(max_entries, -1, dtype=np.int32)
+        self.created = np.zeros(max_entries, dtype=np.float64)
+        self.versions = np.zeros(max_entries, dtype=np.int64)
+        self.latencies = np.zeros(max_entries, dtype=np.float64)
+        self.variant_ids = {}
+        self.next_slot = 0
+        self.catalog_version = 0
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.errors = 0
+        self.saved_ms = 0.0
+        self.shared = shared
+        if shared is not None: shared.subscribe("responses", lambda endpoint, key: self._next_version())
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.97)),
+            ttl=float(os.getenv("SEMANTIC_CACHE_TTL", 600)),
+            max_entries=int(os.getenv("SEMANTIC_CACHE_SIZE", 2000)),
+            shared=shared_state,
+        )
+
+    def _variant(self, variant) -> int:
+        return self.variant_ids.setdefault(variant, len(self.variant_ids))
+
+    def _normalize(self, vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def lookup(self, vector, variant):
+        """
+        Return (response, similarity) of the closest live entry above the threshold, otherwise None.
+        """
+        if self.shared is not None: self.shared.poll()
+        if self.matrix is None:
+            self.misses += 1
+            return None
+        query = self._normalize(vector)
+        live = np.flatnonzero(
+            (self.variants == self._variant(variant))
+            & (self.versions == self.catalog_version)
+            & (self.created >= time.time() - self.ttl)
+        )
+        if len(live):
+            scores = self.matrix[live] @ query
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                slot = live[best]
+                self.hits += 1
+                self.saved_ms += float(self.latencies[slot])
+                return self.responses[slot], float(scores[best])
+        self.misses += 1
+        return None
+
+    def store(self, vector, variant, response: dict, latency_ms: float = 0.0):
+        query = self._normalize(vector)
+        if self.matrix is None:
+            self.matrix = np.zeros((self.max_entries, len(query)), dtype=np.float32)
+        slot = self.next_slot
+        self.next_slot = (slot + 1) % self.max_entries
+        self.matrix[slot] = query
+        self.responses[slot] = response
+        self.variants[slot] = self._variant(variant)
+        self.created[slot] = time.time()
+        self.versions[slot] = self.catalog_version
+        self.latencies[slot] = latency_ms
+
+    def bypass(self):
+        self.bypassed += 1
+
+    def bump_catalog_version(self):
+        """
+        Mark every cached response stale, called when products change.
+        """
+        if self.shared is not None: self.shared.publish("responses", "catalog")
+        self._next_version()
+
+    def _next_version(self):
+        self.catalog_version += 1
+
+    def clear(self):
+        self.variants[:] = -1
+        self.responses = [None] * self.max_entries
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "errors": self.errors,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "saved_ms": self.saved_ms,
+            "entries": int((self.variants >= 0).sum()),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "catalog_version": self.catalog_version,
+        }
+
+response_cache = SemanticResponseCache.from_env()
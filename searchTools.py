@@ -1,12 +1,79 @@
-import requests
-import json
-from agents import function_tool
-from utils import get_node_base_uri
+from agents import function_tool, RunContextWrapper
+from utils import User, record_product_ids, get_products_collection, product_cards
+from httpClient import node_request
+from nodeResilience import node_tool_error
+from productCache import product_cache
+from tracing import aspan
+import asyncio
+import os
 
-node_base_url = get_node_base_uri()
+def cacheable_response(value) -> bool:
+    return value[0] in (200, 404)
 
-@function_tool
-def search_by_category(category: str, limit: int = 15) -> str :
+def remember_products(products: list):
+    # Category and fuzzy pages carry full products, seed the by-id entries with them.
+    for product in products:
+        product_id = product.get('_id') if isinstance(product, dict) else None
+        if product_id is not None and product_cache.get("id", str(product_id)) is None:
+            product_cache.set("id", str(product_id), (200, product))
+
+async def fetch_products(path: str, params: dict = None):
+    response = await node_request("GET", path, params=params)
+    if response.status_code != 200: return (response.status_code, [])
+    products = response.json().get('products', [])
+    remember_products(products)
+    return (200, products)
+
+async def fetch_product(product_id: int):
+    response = await node_request("GET", f"/app/search/id/{product_id}")
+    if response.status_code != 200: return (response.status_code, None)
+    return (200, response.json().get('product', {}))
+
+async def fetch_products_by_ids(product_ids: list) -> dict:
+    """
+    Look up uncached products with a single $in query on Spark.products.
+    Returns {product_id: (status_code, product)} for every requested id.
+    """
+    def find():
+        cursor = get_products_collection().find({"_id": {"$in": product_ids}}, {"embedding_text": 1, "name": 1, "category": 1})
+        return {product["_id"]: product for product in cursor}
+
+    async with aspan("mongo", "find_by_ids"):
+        found = await asyncio.to_thread(find)
+    return {product_id: (200, found[product_id]) if product_id in found else (404, None) for product_id in product_ids}
+
+async def lookup_products(product_ids: list) -> dict:
+    """
+    Resolve product ids through the product cache; misses go to the Node backend concurrently,
+    or to one Mongo $in query when PRODUCT_LOOKUP_BACKEND=mongo.
+    Returns {product_id: (status_code, product)}.
+    """
+    if os.getenv("PRODUCT_LOOKUP_BACKEND", "node") != "mongo":
+        values = await asyncio.gather(*(
+            product_cache.get_or_fetch("id", str(product_id), lambda product_id=product_id: fetch_product(product_id), cacheable=cacheable_response)
+            for product_id in product_ids
+        ), return_exceptions=True)
+        return {product_id: (None, None) if isinstance(value, Exception) else value for product_id, value in zip(product_ids, values)}
+
+    results = {}
+    for product_id in product_ids:
+        cached = product_cache.get("id", str(product_id))
+        if cached is not None: results[product_id] = cached
+    missing = [product_id for product_id in product_ids if product_id not in results]
+    product_cache.hits += len(results)
+    product_cache.misses += len(missing)
+    if missing:
+        fetched = await fetch_products_by_ids(missing)
+        for product_id, value in fetched.items(): product_cache.set("id", str(product_id), value)
+        results.update(fetched)
+    return results
+
+def format_products(products: list, details: bool = False) -> str:
+    if details: return '\n'.join(product.get('embedding_text', '') for product in products)
+    return '\n'.join(f"ID: {product.get('_id')}: {card}" for product, card in zip(products, product_cards.cards(products)))
+
+@function_tool(failure_error_function=node_tool_error)
+async def search_by_category(context: RunContextWrapper[User], category: str, limit: int = 15, details: bool = False) -> str :
     """
     Search for products by category from the Database. 
     Category should be one of:
@@ -18,25 +85,25 @@ def search_by_category(category: str, limit: int = 15) -> str :
     Args:
         category (str): The category to search in.
         limit (int): The number of products to return. Default is 20.
+        details (bool): Return full product details instead of short product cards. Default is False.
     """
     print("-----------------Searched by cat-----------------")
-    url = node_base_url + f"/app/search/category/{category}?page=1&limit={limit}"
-    headers = {"Content-Type": "application/json"}
-    
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        response_data = json.loads(response.text)
-        product_data = response_data.get('products',[])
-        products = [product.get('embedding_text','') for product in product_data]
-        return '\n'.join(products)
-
-    elif response.status_code == 404:
+    status_code, product_data = await product_cache.get_or_fetch(
+        "category", f"{category}:{limit}",
+        lambda: fetch_products(f"/app/search/category/{category}", {"page": 1, "limit": limit}),
+        cacheable=cacheable_response,
+    )
+    if status_code == 200:
+        record_product_ids(context, (product.get('_id') for product in product_data))
+        return format_products(product_data, details)
+
+    elif status_code == 404:
         return "No products found in this category."
     
     return "Trouble fetching products"
 
-@function_tool
-def search_by_id(product_id: int) -> str:
+@function_tool(failure_error_function=node_tool_error)
+async def search_by_id(context: RunContextWrapper[User], product_id: int) -> str:
     """
     Search for a product by its Product ID from the Database.
     
@@ -47,45 +114,78 @@ def search_by_id(product_id: int) -> str:
         str: Details of the product if found, otherwise an error message.
     """
     print("-----------------Searched by Id-----------------")
-    url = node_base_url + f"/app/search/id/{product_id}"
-    headers = {"Content-Type": "application/json"}
-    
-    response = requests.get(url, headers=headers)
+    status_code, product = await product_cache.get_or_fetch(
+        "id", str(product_id), lambda: fetch_product(product_id), cacheable=cacheable_response
+    )
 
-    if response.status_code == 200:
-        response_data = json.loads(response.text)
-        return response_data.get('product', {}).get('embedding_text', 'No details available for this product.')
+    if status_code == 200:
+        record_product_ids(context, [product.get('_id', product_id)])
+        return product.get('embedding_text', 'No details available for this product.')
     
-    elif response.status_code == 404:
+    elif status_code == 404:
         return "Product not found."
     
     return "Trouble fetching product details"
 
-@function_tool
-def fuzzy_search(query: str, limit: int = 15) -> str:
+@function_tool(failure_error_function=node_tool_error)
+async def fuzzy_search(context: RunContextWrapper[User], query: str, limit: int = 15, details: bool = False) -> str:
     """
     Perform a fuzzy search for products based on a query string from the Database.
     
     Args:
         query (str): The search query string.
         limit (int): The number of products to return. Default is 15.
+        details (bool): Return full product details instead of short product cards. Default is False.
     
     Returns:
         str: Details of the products found, or an error message if no products are found.
     """
     print("-----------------Searched by Fuzzy-----------------")
-    url = node_base_url + f"/app/search/fuzzy?q={query}&page=1&limit={limit}$page=1"
-    headers = {"Content-Type": "application/json"}
-    
-    response = requests.get(url, headers=headers)
+    status_code, product_data = await product_cache.get_or_fetch(
+        "fuzzy", f"{' '.join(query.split()).casefold()}:{limit}",
+        lambda: fetch_products("/app/search/fuzzy", {"q": query, "page": 1, "limit": limit}),
+        cacheable=cacheable_response,
+    )
     
-    if response.status_code == 200:
-        response_data = json.loads(response.text)
-        product_data = response_data.get('products', [])
-        products = [product.get('embedding_text', '') for product in product_data]
-        return '\n'.join(products)
+    if status_code == 200:
+        record_product_ids(context, (product.get('_id') for product in product_data))
+        return format_products(product_data, details)
     
-    elif response.status_code == 404:
+    elif status_code == 404:
         return "No products found matching the query."
     
-    return "Trouble fetching products"
\ No newline at end of file
+    return "Trouble fetching products"
+
+@function_tool(failure_error_function=node_tool_error)
+async def search_by_ids(context: RunContextWrapper[User], product_ids: list[int], details: bool = False) -> str:
+    """
+    Look up several products by their Product IDs in one call. Prefer this over repeated search_by_id calls.
+    
+    Args:
+        product_ids (list[int]): The Product IDs to look up.
+        details (bool): Return full product details instead of short product cards. Default is False.
+    
+    Returns:
+        str: One line of details per product, in the order given.
+    """
+    print("-----------------Searched by Ids-----------------")
+    product_ids = list(dict.fromkeys(product_ids))[:int(os.getenv("SEARCH_BY_IDS_MAX", 50))]
+    if not product_ids:
+        return "No product ids were provided."
+
+    results = await lookup_products(product_ids)
+    # By-id payloads may lack _id; cards are matched to the requested ids by position.
+    found = [{**results[product_id][1], "_id": results[product_id][1].get('_id', product_id)} for product_id in product_ids if results[product_id][0] == 200]
+    cards = iter([] if details else product_cards.cards(found))
+    lines = []
+    for product_id in product_ids:
+        status_code, product = results[product_id]
+        if status_code == 200:
+            text = product.get('embedding_text', 'No details available for this product.') if details else next(cards)
+            lines.append(f"ID: {product_id}: {text}")
+        elif status_code == 404:
+            lines.append(f"ID: {product_id}: Product not found.")
+        else:
+            lines.append(f"ID: {product_id}: Trouble fetching product details")
+    record_product_ids(context, (product_id for product_id in product_ids if results[product_id][0] == 200))
+    return '\n'.join(lines)
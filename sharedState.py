@@ -0,0 +1,226 @@
+import threading
+import sqlite3
+import queue
+import uuid
+import json
+import time
+import os
+
+class SharedState:
+    """
+    SQLite file (WAL mode) shared by every uvicorn worker on the host.
+    Holds a key/value tier behind the in-process caches and an invalidation log: a process that
+    drops cache entries publishes an event, and the other workers apply it the next time they poll.
+    """
+    def __init__(self, path: str, poll_interval: float = 0.5, busy_timeout: float = 5.0):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.origin = uuid.uuid4().hex
+        self.lock = threading.Lock()
+        self.subscribers = {}
+        self.last_poll = 0.0
+        self.writes = 0
+        # Invalidations of this process not committed yet: (namespace, endpoint, key) -> count, None as wildcard.
+        self.pending = {}
+        self.pending_lock = threading.Lock()
+        self.db = connect(path, busy_timeout)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                namespace TEXT NOT NULL,
+                endpoint TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires REAL NOT NULL,
+                PRIMARY KEY (namespace, endpoint, key)
+            )
+        """)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS invalidations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                namespace TEXT NOT NULL,
+                endpoint TEXT,
+                key TEXT,
+                origin TEXT NOT NULL,
+                created REAL NOT NULL
+            )
+        """)
+        self.db.commit()
+        row = self.db.execute("SELECT MAX(id) FROM invalidations").fetchone()
+        self.seen = row[0] or 0
+        # Writes go through a background thread so callers on the event loop never wait for the write lock.
+        self.writer = WriteBehind(path, busy_timeout, name="shared-state-writer")
+
+    @classmethod
+    def from_env(cls):
+        path = os.getenv("SHARED_STATE_PATH")
+        if not path: return None
+        return cls(path, poll_interval=float(os.getenv("SHARED_STATE_POLL_SECONDS", 0.5)))
+
+    def get(self, namespace: str, endpoint: str, key: str):
+        """
+        Return (value, expires) with expires as a unix timestamp, or None when missing or expired.
+        Rows this process invalidated are treated as missing until the DELETE is committed.
+        """
+        if self.pending and self._invalidated(namespace, endpoint, key): return None
+        with self.lock:
+            row = self.db.execute(
+                "SELECT value, expires FROM cache WHERE namespace = ? AND endpoint = ? AND key = ?", (namespace, endpoint, key)
+            ).fetchone()
+        if row is None or row[1] < time.time(): return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, namespace: str, endpoint: str, key: str, value, ttl: float):
+        now = time.time()
+        self.writer.put(
+            "INSERT OR REPLACE INTO cache (namespace, endpoint, key, value, expires) VALUES (?, ?, ?, ?, ?)",
+            (namespace, endpoint, key, json.dumps(value, default=str), now + ttl),
+        )
+        self.writes += 1
+        if self.writes % 1000 == 0:
+            self.writer.put("DELETE FROM cache WHERE expires < ?", (now,))
+            self.writer.put("DELETE FROM invalidations WHERE created < ?", (now - 3600,))
+
+    def publish(self, namespace: str, endpoint: str = None, key: str = None):
+        """
+        Drop matching shared entries and tell the other workers to drop their local copies.
+        With no endpoint the whole namespace is invalidated.
+        """
+        if endpoint is None:
+            delete = ("DELETE FROM cache WHERE namespace = ?", (namespace,))
+        elif key is None:
+            delete = ("DELETE FROM cache WHERE namespace = ? AND endpoint = ?", (namespace, endpoint))
+        else:
+            delete = ("DELETE FROM cache WHERE namespace = ? AND endpoint = ? AND key = ?", (namespace, endpoint, key))
+        event = (
+            "INSERT INTO invalidations (namespace, endpoint, key, origin, created) VALUES (?, ?, ?, ?, ?)",
+            (namespace, endpoint, key, self.origin, time.time()),
+        )
+        scope = (namespace, endpoint, key)
+        with self.pending_lock: self.pending[scope] = self.pending.get(scope, 0) + 1
+        self.writer.put_all([delete, event], required=True, on_commit=lambda: self._committed(scope))
+
+    def _committed(self, scope: tuple):
+        with self.pending_lock:
+            count = self.pending.pop(scope, 1) - 1
+            if count: self.pending[scope] = count
+
+    def _invalidated(self, namespace: str, endpoint: str, key: str) -> bool:
+        with self.pending_lock:
+            return any(scope in self.pending for scope in ((namespace, None, None), (namespace, endpoint, None), (namespace, endpoint, key)))
+
+    def subscribe(self, namespace: str, callback):
+        """
+        Register callback(endpoint, key) for invalidations published by other processes.
+        """
+        self.subscribers.setdefault(namespace, []).append(callback)
+
+    def poll(self, force: bool = False):
+        """
+        Apply invalidations published by other workers since the last poll.
+        Cheap to call on every cache access, it only queries once per poll_interval.
+        """
+        now = time.monotonic()
+        if not force and now - self.last_poll < self.poll_interval: return
+        self.last_poll = now
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT id, namespace, endpoint, key, origin FROM invalidations WHERE id > ? ORDER BY id", (self.seen,)
+            ).fetchall()
+        for event_id, namespace, endpoint, key, origin in rows:
+            self.seen = event_id
+            if origin == self.origin: continue
+            for callback in self.subscribers.get(namespace, []): callback(endpoint, key)
+
+    def stats(self) -> dict:
+        return {"path": self.path, "writer": self.writer.stats()}
+
+    def close(self):
+        self.writer.close()
+
+class WriteBehind:
+    """
+    Background thread applying queued SQLite writes on its own connection. Whatever is queued
+    while a commit runs goes into the next transaction, so busy files get fewer, larger commits.
+    Writes are best effort: past max_queue waiting writes they are dropped and counted. Required
+    writes (invalidations) are always queued and retried after a failed commit.
+    """
+    def __init__(self, path: str, busy_timeout: float = 5.0, max_queue: int = 100000, max_batch: int = 1000, name: str = "sqlite-writer"):
+        self.db = connect(path, busy_timeout)
+        self.queue = queue.Queue()
+        self.max_queue = max_queue
+        self.max_batch = max_batch
+        self.written = 0
+        self.commits = 0
+        self.dropped = 0
+        self.errors = 0
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def put(self, sql: str, params: tuple = (), required: bool = False, on_commit=None):
+        self.put_all([(sql, params)], required, on_commit)
+
+    def put_all(self, statements: list, required: bool = False, on_commit=None):
+        """
+        Queue [(sql, params)] to be committed together; on_commit is called from the writer thread afterwards.
+        """
+        if not required and self.queue.qsize() >= self.max_queue:
+            self.dropped += 1
+            return
+        self.queue.put((statements, required, on_commit))
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            closing = None in batch
+            self._apply([item for item in batch if item is not None])
+            for _ in batch: self.queue.task_done()
+            if closing: return
+
+    def _apply(self, batch: list):
+        if not batch: return
+        try:
+            for statements, _, _ in batch:
+                for sql, params in statements: self.db.execute(sql, params)
+            self.db.commit()
+        except sqlite3.Error:
+            self.db.rollback()
+            self.errors += 1
+            retry = [item for item in batch if item[1]]
+            if retry:
+                time.sleep(0.1)
+                for item in retry: self.queue.put(item)
+            self.dropped += len(batch) - len(retry)
+            return
+        self.written += len(batch)
+        self.commits += 1
+        for _, _, on_commit in batch:
+            if on_commit is not None: on_commit()
+
+    def flush(self):
+        """
+        Block until everything queued so far is written.
+        """
+        self.queue.join()
+
+    def close(self, timeout: float = 10.0):
+        if not self.thread.is_alive(): return
+        self.queue.put(None)
+        self.thread.join(timeout=timeout)
+        # A writer still busy after the timeout keeps its connection; it is a daemon thread.
+        if not self.thread.is_alive(): self.db.close()
+
+    def stats(self) -> dict:
+        return {"queued": self.queue.qsize(), "written": self.written, "commits": self.commits, "dropped": self.dropped, "errors": self.errors}
+
+def connect(path: str, busy_timeout: float = 5.0) -> sqlite3.Connection:
+    db = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    return db
+
+shared_state = SharedState.from_env()
@@ -0,0 +1,212 @@
+from agents import add_trace_processor
+from agents.tracing import TracingProcessor
+from contextlib import contextmanager, asynccontextmanager
+from contextvars import ContextVar
+import threading
+import bisect
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra: pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labels)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(self.labels, key)} {value}")
+        return lines
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self.key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            for key, (counts, total) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    bucket_labels = format_labels(self.labels, key, 'le="' + le + '"')
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {total}")
+                lines.append(f"{self.name}_count{format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics: lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+stage_duration = registry.register(Histogram("sparky_stage_duration_seconds", "Duration of request stages (llm, agent, tool, handoff, embedding, mongo, node_http, structuring).", ("stage", "name")))
+stage_errors = registry.register(Counter("sparky_stage_errors_total", "Request stages that raised.", ("stage", "name")))
+stage_in_flight = registry.register(Gauge("sparky_stage_in_flight", "Request stages currently running.", ("stage",)))
+llm_tokens = registry.register(Counter("sparky_llm_tokens_total", "LLM tokens used, by model and kind (input/output).", ("model", "kind")))
+http_duration = registry.register(Histogram("sparky_http_request_duration_seconds", "HTTP request latency.", ("method", "path")))
+http_requests = registry.register(Counter("sparky_http_requests_total", "HTTP requests by status.", ("method", "path", "status")))
+http_in_flight = registry.register(Gauge("sparky_http_in_flight", "HTTP requests currently being served."))
+
+# Per-request list of (stage, name, seconds) used for the debug timing header. The list is shared with
+# tasks spawned by the request, so spans recorded anywhere in the run end up in it.
+request_trace = ContextVar("request_trace", default=None)
+
+def start_request_trace():
+    return request_trace.set([])
+
+def record_stage(stage: str, name: str, seconds: float, error: bool = False):
+    stage_duration.observe(seconds, stage=stage, name=name)
+    if error: stage_errors.inc(stage=stage, name=name)
+    trace = request_trace.get()
+    if trace is not None: trace.append((stage, name, seconds))
+
+def record_tokens(model: str, input_tokens: int = 0, output_tokens: int = 0):
+    if input_tokens: llm_tokens.inc(input_tokens, model=model or "unknown", kind="input")
+    if output_tokens: llm_tokens.inc(output_tokens, model=model or "unknown", kind="output")
+
+@contextmanager
+def span(stage: str, name: str = ""):
+    """
+    Time a block of code as one stage of the current request.
+    """
+    stage_in_flight.inc(stage=stage)
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        stage_in_flight.dec(stage=stage)
+        record_stage(stage, name, time.perf_counter() - start, error)
+
+@asynccontextmanager
+async def aspan(stage: str, name: str = ""):
+    with span(stage, name):
+        yield
+
+def server_timing(trace: list) -> str:
+    """
+    Aggregate a request trace into a Server-Timing header value, e.g. `llm;dur=812.4;desc="3 calls"`.
+    """
+    totals = {}
+    for stage, _, seconds in trace:
+        total, calls = totals.get(stage, (0.0, 0))
+        totals[stage] = (total + seconds, calls + 1)
+    return ", ".join(f'{stage};dur={total * 1000:.1f};desc="{calls} calls"' for stage, (total, calls) in totals.items())
+
+class MetricsTraceProcessor(TracingProcessor):
+    """
+    Turns agents SDK spans (agent runs, LLM responses, function tools, handoffs) into stage metrics.
+    """
+    SPAN_STAGES = {"agent": "agent", "response": "llm", "generation": "llm", "function": "tool", "handoff": "handoff"}
+
+    def __init__(self):
+        self.started = {}
+
+    def on_trace_start(self, trace):
+        pass
+
+    def on_trace_end(self, trace):
+        pass
+
+    def on_span_start(self, span):
+        stage = self.SPAN_STAGES.get(span.span_data.type)
+        if stage is None: return
+        self.started[span.span_id] = time.perf_counter()
+        stage_in_flight.inc(stage=stage)
+
+    def on_span_end(self, span):
+        start = self.started.pop(span.span_id, None)
+        stage = self.SPAN_STAGES.get(span.span_data.type)
+        if start is None or stage is None: return
+        stage_in_flight.dec(stage=stage)
+        data = span.span_data
+        name = ""
+        if data.type in ("agent", "function"):
+            name = data.name
+        elif data.type == "handoff":
+            name = f"{data.from_agent}->{data.to_agent}"
+        elif data.type == "response" and data.response is not None:
+            name = data.response.model
+            usage = data.response.usage
+            if usage is not None: record_tokens(name, usage.input_tokens, usage.output_tokens)
+        elif data.type == "generation":
+            name = data.model or ""
+            usage = data.usage or {}
+            record_tokens(name, usage.get("input_tokens", 0), usage.get("output_tokens", 0))
+        record_stage(stage, name, time.perf_counter() - start, error=span.error is not None)
+
+    def shutdown(self):
+        pass
+
+    def force_flush(self):
+        pass
+
+metrics_processor = MetricsTraceProcessor()
+add_trace_processor(metrics_processor)
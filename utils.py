@@ -1,6 +1,7 @@
-from agents import function_tool, RunContextWrapper
-from openai import OpenAI, RateLimitError
+from agents import function_tool, RunContextWrapper, set_default_openai_client
+from openai import OpenAI, AsyncOpenAI, RateLimitError, DefaultHttpxClient, DefaultAsyncHttpxClient
 import pydantic
+import httpx
 import pymongo
 import dotenv
 import time
@@ -8,18 +9,40 @@ import json
 import sys
 import os
 from typing import Optional
+from embeddingCache import embedding_cache
+from embeddingBatcher import EmbeddingBatcher
+from vectorIndex import product_index
+from embeddingProfile import EmbeddingProfile, embedding_profile
+from productTagger import tag_product_ids, tag_labelled_ids
+from productCards import product_cards, compact_product
+from tracing import span, record_tokens
+from rateLimiter import openai_limiter, event_hooks, async_event_hooks
+import asyncio
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
+dotenv.load_dotenv()
+
+# Process-lifetime clients, created once (normally from the FastAPI lifespan) and shared by every request.
+_clients = {}
+
 class User(pydantic.BaseModel):
     name: str
     age: int
     last_response_id: Optional[str] = None
     user_jwt: Optional[str] = None
+    product_ids: set = pydantic.Field(default_factory=set)
+
+def record_product_ids(context: RunContextWrapper[User], product_ids):
+    """
+    Remember product ids a tool returned during this run, used to tag the final output.
+    """
+    user = getattr(context, "context", None)
+    if isinstance(user, User):
+        user.product_ids.update(str(product_id) for product_id in product_ids if product_id is not None)
 
 
 def get_key():
-    dotenv.load_dotenv()
     openai_api_key = os.getenv("OPENAI_API_KEY")
     if openai_api_key:
         return openai_api_key
@@ -27,7 +50,6 @@ def get_key():
         raise ValueError("OpenAI API key not found in the environment variables.")
 
 def get_node_base_uri():
-    dotenv.load_dotenv()
     node_base_uri = os.getenv("NODE_BASE_URI")
     if node_base_uri:
         return node_base_uri
@@ -49,12 +71,23 @@ def write_out(output,fresh=False):
         f.write(output)
     return
 
-def get_products_collection():
+def initialize_mongo_client():
     uri = os.getenv('MONGO_URI')
-    client = pymongo.MongoClient(uri)
-    db = client.get_database("Spark")
-    collection = db.get_collection("products")
-    return collection
+    client = pymongo.MongoClient(
+        uri,
+        maxPoolSize=int(os.getenv('MONGO_MAX_POOL_SIZE', 100)),
+        minPoolSize=int(os.getenv('MONGO_MIN_POOL_SIZE', 0)),
+    )
+    return client
+
+def get_openai_limits():
+    return httpx.Limits(
+        max_connections=int(os.getenv('OPENAI_MAX_CONNECTIONS', 100)),
+        max_keepalive_connections=int(os.getenv('OPENAI_MAX_KEEPALIVE', 20)),
+    )
+
+def get_openai_max_retries() -> int:
+    return int(os.getenv('OPENAI_MAX_RETRIES', 2))
 
 def initialize_openai_client():
     key = get_key()
@@ -65,13 +98,83 @@ def initialize_openai_client():
         api_key=key,
         organization=org_key,
         project=project_id,
+        max_retries=get_openai_max_retries(),
+        # Every sync call (embeddings, structuring) shares the process-wide RPM/TPM budget.
+        http_client=DefaultHttpxClient(limits=get_openai_limits(), event_hooks=event_hooks(openai_limiter)),
     )
     return client
 
+def initialize_async_openai_client():
+    key = get_key()
+    org_key = os.getenv('OPENAI_ORG_KEY')
+    project_id = os.getenv('OPENAI_PROJECT_ID')
+
+    client = AsyncOpenAI(
+        api_key=key,
+        organization=org_key,
+        project=project_id,
+        max_retries=get_openai_max_retries(),
+        http_client=DefaultAsyncHttpxClient(limits=get_openai_limits(), event_hooks=async_event_hooks(openai_limiter)),
+    )
+    return client
+
+def get_mongo_client():
+    if "mongo" not in _clients:
+        _clients["mongo"] = initialize_mongo_client()
+    return _clients["mongo"]
+
+def get_openai_client():
+    if "openai" not in _clients:
+        _clients["openai"] = initialize_openai_client()
+    return _clients["openai"]
+
+def get_async_openai_client():
+    if "async_openai" not in _clients:
+        _clients["async_openai"] = initialize_async_openai_client()
+    return _clients["async_openai"]
+
+def init_clients():
+    """
+    Create the shared Mongo and OpenAI clients and make the agents SDK use the pooled async client.
+    """
+    get_mongo_client()
+    get_openai_client()
+    set_default_openai_client(get_async_openai_client())
+
+async def close_clients():
+    embedding_cache.close()
+    mongo = _clients.pop("mongo", None)
+    if mongo is not None: mongo.close()
+    openai_client = _clients.pop("openai", None)
+    if openai_client is not None: openai_client.close()
+    async_openai = _clients.pop("async_openai", None)
+    if async_openai is not None: await async_openai.close()
+
+def get_products_collection():
+    db = get_mongo_client().get_database("Spark")
+    collection = db.get_collection("products")
+    return collection
+
 def get_embedding(text, model="text-embedding-3-large"):
-    client = initialize_openai_client()
     text = text.replace("\n", " ")
-    return client.embeddings.create(input = [text], model=model).data[0].embedding
+    cached = embedding_cache.get(text, model)
+    if cached is not None: return cached
+    client = get_openai_client()
+    with span("embedding", model):
+        embedding = client.embeddings.create(input = [text], model=model).data[0].embedding
+    embedding_cache.set(text, model, embedding)
+    return embedding
+
+embedding_batcher = EmbeddingBatcher.from_env(get_async_openai_client)
+
+async def aget_embedding(text, model="text-embedding-3-large"):
+    text = text.replace("\n", " ")
+    cached = embedding_cache.get(text, model)
+    if cached is not None: return cached
+    with span("embedding", model):
+        embedding = await embedding_batcher.embed(text, model)
+    embedding_cache.set(text, model, embedding)
+    return embedding
 
 @function_tool
 async def get_user_info(context: RunContextWrapper[User]) -> str:
@@ -80,19 +183,25 @@ async def get_user_info(context: RunContextWrapper[User]) -> str:
     """
     return f'{context.context.name} is {context.context.age} years old.'
 
-@function_tool
-def retrieve_products(query:str,limit:int) -> str:
-    query_embedding = get_embedding(query)
+def use_local_vector_index() -> bool:
+    return os.getenv("VECTOR_SEARCH_BACKEND", "mongo") == "local" and product_index.ready
+
+def mongo_vector_search(query_embedding, limit: int, exact: bool = None, num_candidates: int = None, profile: EmbeddingProfile = None) -> list:
+    profile = profile or embedding_profile
+    # Atlas only uses the quantized copy of a quantized index for ANN queries (and rescores them itself).
+    if exact is None: exact = not profile.quantized
     collection = get_products_collection()
+    search = {
+        "index": profile.index,
+        "queryVector": profile.reduce(query_embedding).tolist() if profile.reduced else query_embedding,
+        "path": profile.field,
+        "exact": exact,
+        "limit": limit
+    }
+    if not exact: search["numCandidates"] = num_candidates or limit * 10
     pipeline = [
     {
-        "$vectorSearch": {
-                "index": "vector_index",
-                "queryVector": query_embedding,
-                "path": "embedding",
-                "exact": True,
-                "limit": limit
-        }
+        "$vectorSearch": search
     }, 
     {
         "$project": {
@@ -104,34 +213,79 @@ def retrieve_products(query:str,limit:int) -> str:
         }
     }
     ]
-    results = collection.aggregate(pipeline)
+    with span("mongo", "vector_search"):
+        return list(collection.aggregate(pipeline))
+
+def format_retrieved_products(results: list, details: bool = False) -> str:
     text = "Here are All the Products Fetched from the vector Database:\n"
-    for result in results: text += f"\nID: {result['_id']}, \nProduct: {result['embedding_text']}, \nMatch score: {result['score']}\n"
+    if details:
+        for result in results: text += f"\nID: {result['_id']}, \nProduct: {result['embedding_text']}, \nMatch score: {result['score']}\n"
+        return text
+    for result, card in zip(results, product_cards.cards(results)): text += f"\nID: {result['_id']} (score {result['score']:.3f}): {card}"
     return text
 
+async def search_products(query: str, limit: int) -> list:
+    query_embedding = await aget_embedding(query)
+    if use_local_vector_index():
+        with span("vector_index", "search"):
+            matches = await asyncio.to_thread(product_index.search, query_embedding, limit)
+        return [{"_id": product_id, "embedding_text": text, "score": score} for product_id, text, score in matches]
+    return await asyncio.to_thread(mongo_vector_search, query_embedding, limit)
+
+@function_tool
+async def retrieve_products(context: RunContextWrapper[User], query:str, limit:int, details: bool = False) -> str:
+    """
+    Retrieve products similar to the query from the vector database.
+    Args:
+        query (str): What the user is looking for.
+        limit (int): The number of products to return.
+        details (bool): Return full product details instead of short product cards. Defaults to False.
+    """
+    results = await search_products(query, limit)
+    record_product_ids(context, (result['_id'] for result in results))
+    return format_retrieved_products(results, details)
+
 def final_product_structured(agent_response: str, model="gpt-4o") -> str:
-    client = initialize_openai_client()
+    client = get_openai_client()
     try:
-        response = client.responses.create(
-            model="gpt-4o",
-            input=[
-                {
-                    "role": "system", 
-                    "content":  """
-                                    You Structure outputs for an ai shopping assistant.
-                                    You will be given proper markdown response.
-                                    The response should remain exactly same.
-                                    If there are products, you have to insert the product ids in an xml tag <id></id>.
-                                    Do this only for the products with ids.
-                                """
-                },
-                {
-                    "role": "user",
-                    "content": agent_response,
-                },
-            ]
-        )
+        with span("structuring", model):
+            response = client.responses.create(
+                model=model,
+                input=[
+                    {
+                        "role": "system", 
+                        "content":  """
+                                        You Structure outputs for an ai shopping assistant.
+                                        You will be given proper markdown response.
+                                        The response should remain exactly same.
+                                        If there are products, you have to insert the product ids in an xml tag <id></id>.
+                                        Do this only for the products with ids.
+                                    """
+                    },
+                    {
+                        "role": "user",
+                        "content": agent_response,
+                    },
+                ]
+            )
     except RateLimitError:
+        if model == "gpt-4": raise
         return final_product_structured(agent_response, model="gpt-4")
+    if response.usage is not None: record_tokens(model, response.usage.input_tokens, response.usage.output_tokens)
     return response.output_text
 
+async def structure_product_ids(agent_response: str, product_ids) -> str:
+    """
+    Tag product ids in the final output with <id></id> without a model call.
+    Ids recorded from tool outputs during the run are tagged where they are labelled ("ID: 123").
+    Labelled ids no tool returned this run (e.g. from earlier turns) and known ids written as bare
+    numbers make the output ambiguous: it goes through the final_product_structured LLM pass when
+    STRUCTURING_LLM_FALLBACK=1, otherwise labelled ids are tagged and bare numbers left alone.
+    """
+    with span("structuring", "local"):
+        tagged, ambiguous = tag_product_ids(agent_response, product_ids)
+    if not ambiguous: return tagged
+    if os.getenv("STRUCTURING_LLM_FALLBACK", "0") == "1":
+        return await asyncio.to_thread(final_product_structured, agent_response)
+    return tag_labelled_ids(tagged)
+
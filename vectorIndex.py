@@ -0,0 +1,279 @@
+from embeddingProfile import EmbeddingProfile, embedding_profile
+from collections import Counter
+import numpy as np
+import threading
+import logging
+import time
+import os
+
+logger = logging.getLogger("fastapi_logger")
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def spherical_kmeans(data: np.ndarray, nlist: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(data), max(nlist * 32, 10000))
+    sample = data[rng.choice(len(data), sample_size, replace=False)]
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        empty = ~np.bincount(assignments, minlength=nlist).astype(bool)
+        sums[empty] = centroids[empty]
+        centroids = normalize_rows(sums)
+    return centroids
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    if k >= len(scores): return np.argsort(-scores)
+    best = np.argpartition(-scores, k)[:k]
+    return best[np.argsort(-scores[best])]
+
+class VectorIndex:
+    """
+    In-memory mirror of the embedding and embedding_text fields of Spark.products.
+    Vectors live in one contiguous, L2-normalized float32 matrix. Catalogs smaller than
+    exact_threshold are searched with an exact dot product; larger ones use an IVF index
+    (spherical k-means coarse quantizer) where nprobe trades recall for latency.
+    Vectors are reduced to the embedding profile's dimensions; a quantized profile also keeps
+    compact codes that rank the candidates before the best k * rescore are scored exactly.
+    Refreshes pull changed products by updated_field; deleted products are found by comparing
+    all ids with the collection every reconcile_interval seconds.
+    """
+    def __init__(self, nlist: int = None, nprobe: int = 8, exact_threshold: int = 20000, updated_field: str = "updatedAt", profile: EmbeddingProfile = None, reconcile_interval: float = 600):
+        self.profile = profile or EmbeddingProfile()
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.exact_threshold = exact_threshold
+        self.updated_field = updated_field
+        self.reconcile_interval = reconcile_interval
+        self.lock = threading.Lock()
+        self.ids = []
+        self.id_to_row = {}
+        self.texts = []
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self.codes = self.scales = None
+        self.alive = np.zeros(0, dtype=bool)
+        self.centroids = None
+        self.assignments = None
+        self.lists = None
+        self.trained_size = 0
+        self.last_updated = None
+        self.loaded_at = None
+        self.reconciled_at = None
+        self.source_dimensions = None
+        self.skipped = 0
+        self.removed = 0
+
+    @classmethod
+    def from_env(cls):
+        nlist = os.getenv("VECTOR_INDEX_NLIST")
+        return cls(
+            nlist=int(nlist) if nlist else None,
+            nprobe=int(os.getenv("VECTOR_INDEX_NPROBE", 8)),
+            exact_threshold=int(os.getenv("VECTOR_INDEX_EXACT_THRESHOLD", 20000)),
+            updated_field=os.getenv("VECTOR_INDEX_UPDATED_FIELD", "updatedAt"),
+            profile=embedding_profile,
+            reconcile_interval=float(os.getenv("VECTOR_INDEX_RECONCILE_SECONDS", 600)),
+        )
+
+    @property
+    def ready(self) -> bool:
+        return self.loaded_at is not None
+
+    def __len__(self):
+        return int(self.alive.sum())
+
+    def _read_products(self, collection, query: dict):
+        source = self.profile.source_field
+        projection = {"_id": 1, source: 1, "embedding_text": 1}
+        if self.updated_field: projection[self.updated_field] = 1
+        query = {source: {"$exists": True}, **query}
+        ids, texts, rows = [], [], []
+        last_updated = self.last_updated
+        for product in collection.find(query, projection, batch_size=1000):
+            try:
+                vector = np.asarray(product[source], dtype=np.float32)
+            except (TypeError, ValueError):
+                vector = np.zeros(0, dtype=np.float32)
+            ids.append(product["_id"])
+            texts.append(product.get("embedding_text", ""))
+            rows.append(vector)
+            updated = product.get(self.updated_field) if self.updated_field else None
+            if updated is not None and (last_updated is None or updated > last_updated): last_updated = updated
+
+        # One malformed vector must not abort the whole load: keep rows of the catalog's vector length.
+        if self.source_dimensions is None:
+            sizes = Counter(row.size for row in rows if row.ndim == 1 and row.size).most_common(1)
+            if sizes: self.source_dimensions = sizes[0][0]
+        valid = [row.ndim == 1 and row.size == self.source_dimensions for row in rows]
+        if not all(valid):
+            skipped = [product_id for product_id, ok in zip(ids, valid) if not ok]
+            self.skipped += len(skipped)
+            logger.warning(f"Local vector index skipped {len(skipped)} products whose {source} is not a vector of {self.source_dimensions} values: {skipped[:10]}")
+            ids = [product_id for product_id, ok in zip(ids, valid) if ok]
+            texts = [text for text, ok in zip(texts, valid) if ok]
+            rows = [row for row, ok in zip(rows, valid) if ok]
+        matrix = np.stack(rows) if rows else None
+        return ids, texts, matrix, last_updated
+
+    def load(self, collection):
+        """
+        Load the full catalog from the products collection and build the index.
+        """
+        self.source_dimensions = None
+        ids, texts, matrix, last_updated = self._read_products(collection, {})
+        if matrix is None: matrix = np.zeros((0, 0), dtype=np.float32)
+        self.build(ids, matrix, texts)
+        self.last_updated = last_updated
+        self.reconciled_at = time.time()
+
+    def refresh(self, collection) -> int:
+        """
+        Pull products changed since the last load or refresh and upsert them.
+        Requires the updated_field timestamp on products, otherwise reloads the whole catalog.
+        """
+        if not self.ready or not self.updated_field or self.last_updated is None:
+            self.load(collection)
+            return len(self)
+        ids, texts, matrix, last_updated = self._read_products(collection, {self.updated_field: {"$gt": self.last_updated}})
+        if ids: self.upsert(ids, matrix, texts)
+        self.last_updated = last_updated
+        changed = len(ids)
+        if time.time() - self.reconciled_at >= self.reconcile_interval: changed += self.reconcile(collection)
+        return changed
+
+    def reconcile(self, collection) -> int:
+        """
+        Remove products that were deleted or lost their vector, which the updated_field query
+        cannot see. Returns the number of products removed.
+        """
+        present = {product["_id"] for product in collection.find({self.profile.source_field: {"$exists": True}}, {"_id": 1}, batch_size=10000)}
+        with self.lock:
+            gone = [product_id for product_id, row in self.id_to_row.items() if self.alive[row] and product_id not in present]
+        if gone: self.remove(gone)
+        self.reconciled_at = time.time()
+        return len(gone)
+
+    def build(self, ids: list, vectors: np.ndarray, texts: list):
+        matrix = np.ascontiguousarray(self.profile.reduce(vectors)) if len(ids) else np.zeros((0, 0), dtype=np.float32)
+        with self.lock:
+            self.ids = list(ids)
+            self.id_to_row = {product_id: row for row, product_id in enumerate(self.ids)}
+            self.texts = list(texts)
+            self.matrix = matrix
+            self.alive = np.ones(len(self.ids), dtype=bool)
+            self._quantize()
+            self._train()
+            self.loaded_at = time.time()
+
+    def _quantize(self):
+        quantized = self.profile.quantize(self.matrix) if len(self.ids) else None
+        self.codes, self.scales = quantized if quantized is not None else (None, None)
+
+    def _train(self):
+        size = len(self.ids)
+        if size < self.exact_threshold:
+            self.centroids = self.assignments = self.lists = None
+            self.trained_size = size
+            return
+        nlist = self.nlist or int(np.sqrt(size))
+        self.centroids = spherical_kmeans(self.matrix, nlist)
+        self.assignments = np.argmax(self.matrix @ self.centroids.T, axis=1)
+        self._rebuild_lists()
+        self.trained_size = size
+
+    def _rebuild_lists(self):
+        order = np.argsort(self.assignments, kind="stable")
+        bounds = np.searchsorted(self.assignments[order], np.arange(len(self.centroids) + 1))
+        self.lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))]
+
+    def upsert(self, ids: list, vectors: np.ndarray, texts: list):
+        vectors = self.profile.reduce(vectors)
+        with self.lock:
+            new_rows = []
+            for product_id, vector, text in zip(ids, vectors, texts):
+                row = self.id_to_row.get(product_id)
+                if row is None:
+                    new_rows.append((product_id, vector, text))
+                    continue
+                self.matrix[row] = vector
+                self.texts[row] = text
+                self.alive[row] = True
+                if self.centroids is not None: self.assignments[row] = int(np.argmax(self.centroids @ vector))
+            if new_rows:
+                start = len(self.ids)
+                appended = np.stack([vector for _, vector, _ in new_rows])
+                self.matrix = np.ascontiguousarray(np.vstack([self.matrix, appended])) if start else appended
+                self.alive = np.concatenate([self.alive, np.ones(len(new_rows), dtype=bool)])
+                for offset, (product_id, _, text) in enumerate(new_rows):
+                    self.ids.append(product_id)
+                    self.texts.append(text)
+                    self.id_to_row[product_id] = start + offset
+                if self.centroids is not None:
+                    self.assignments = np.concatenate([self.assignments, np.argmax(appended @ self.centroids.T, axis=1)])
+            self._quantize()
+            # Retrain once the catalog has grown well past what the coarse quantizer was fit on.
+            if len(self.ids) >= self.exact_threshold and (self.centroids is None or len(self.ids) > 1.2 * self.trained_size):
+                self._train()
+            elif self.centroids is not None:
+                self._rebuild_lists()
+
+    def remove(self, ids: list):
+        with self.lock:
+            for product_id in ids:
+                row = self.id_to_row.get(product_id)
+                if row is not None and self.alive[row]:
+                    self.alive[row] = False
+                    self.removed += 1
+
+    def search(self, query_vector, k: int = 10, exact: bool = False, nprobe: int = None) -> list:
+        """
+        Return up to k (product_id, embedding_text, score) tuples, best first.
+        Scores use the same (1 + cosine) / 2 scale as Atlas vectorSearchScore.
+        """
+        query = self.profile.reduce(query_vector)
+        with self.lock:
+            matrix, alive, ids, texts = self.matrix, self.alive, self.ids, self.texts
+            centroids, lists, codes, scales = self.centroids, self.lists, self.codes, self.scales
+        if not len(ids): return []
+
+        # Only the exact scan yields candidates in row order, so only there can it skip the gather copy.
+        every_row = False
+        if exact or centroids is None:
+            candidates = np.flatnonzero(alive)
+            every_row = len(candidates) == len(ids)
+        else:
+            probes = top_k(centroids @ query, min(nprobe or self.nprobe, len(centroids)))
+            candidates = np.concatenate([lists[probe] for probe in probes])
+            candidates = candidates[alive[candidates]]
+        if not len(candidates): return []
+        shortlist = k * self.profile.rescore
+        if codes is not None and len(candidates) > shortlist:
+            if not every_row: codes, scales = codes[candidates], None if scales is None else scales[candidates]
+            approximate = self.profile.approximate_scores(codes, scales, query)
+            candidates = candidates[top_k(approximate, shortlist)]
+            every_row = False
+        scores = (matrix if every_row else matrix[candidates]) @ query
+        best = top_k(scores, k)
+        return [(ids[candidates[i]], texts[candidates[i]], float((1 + scores[i]) / 2)) for i in best]
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "size": len(self),
+            "dimensions": int(self.matrix.shape[1]) if self.matrix.ndim == 2 and len(self.ids) else 0,
+            "mode": "exact" if self.centroids is None else "ivf",
+            "quantization": self.profile.quantization,
+            "nlist": 0 if self.centroids is None else len(self.centroids),
+            "nprobe": self.nprobe,
+            "loaded_at": self.loaded_at,
+            "reconciled_at": self.reconciled_at,
+            "skipped": self.skipped,
+            "removed": self.removed,
+        }
+
+product_index = VectorIndex.from_env()
@@ -0,0 +1,149 @@
+"""
+Startup warmup: opens the connection pools to OpenAI, Mongo and the Node backend, loads the
+in-process search indexes and preloads hot embedding and product cache entries from the snapshot
+written at the last shutdown. /ready reports ready once it finishes; each step's timing is logged
+and kept for /ready.
+"""
+from contextlib import asynccontextmanager
+from openai import APIStatusError
+import numpy as np
+import asyncio
+import time
+import os
+
+class Warmup:
+    def __init__(self, logger, step_timeout: float = 30.0, strict: bool = False, index_timeout: float = 600.0, product_concurrency: int = 16):
+        self.logger = logger
+        self.step_timeout = step_timeout
+        self.index_timeout = index_timeout
+        self.product_concurrency = product_concurrency
+        self.strict = strict
+        self.steps = {}
+        self.started = time.time()
+        self.finished = None
+
+    @classmethod
+    def from_env(cls, logger):
+        return cls(
+            logger,
+            step_timeout=float(os.getenv("WARMUP_STEP_TIMEOUT", 30)),
+            strict=os.getenv("WARMUP_STRICT", "0") == "1",
+            index_timeout=float(os.getenv("WARMUP_INDEX_TIMEOUT", 600)),
+            product_concurrency=int(os.getenv("WARMUP_PRODUCT_CONCURRENCY", 16)),
+        )
+
+    @property
+    def ready(self) -> bool:
+        if self.finished is None: return False
+        return not self.strict or all(step["status"] == "ok" for step in self.steps.values())
+
+    @asynccontextmanager
+    async def step(self, name: str):
+        """
+        Time a warmup step. Failures are logged and recorded, not raised, so one unreachable
+        dependency does not keep the rest of the warmup from running.
+        """
+        self.steps[name] = {"status": "running", "ms": None}
+        start = time.perf_counter()
+        try:
+            yield
+            self.steps[name]["status"] = "ok"
+        except Exception as e:
+            self.steps[name].update(status="failed", error=f"{type(e).__name__}: {e}")
+        ms = (time.perf_counter() - start) * 1000
+        self.steps[name]["ms"] = round(ms, 1)
+        if self.steps[name]["status"] == "ok":
+            self.logger.info(f"Warmup step {name} took {ms:.0f} ms")
+        else:
+            self.logger.warning(f"Warmup step {name} failed after {ms:.0f} ms: {self.steps[name]['error']}")
+
+    async def run_step(self, name: str, coroutine_function, *args, timeout: float = None):
+        async with self.step(name):
+            await asyncio.wait_for(coroutine_function(*args), timeout or self.step_timeout)
+
+    async def run(self, snapshot_path: str = None, index_loads: dict = None):
+        """
+        Args:
+            index_loads (dict, optional): {step name: load(products_collection)} of the in-process indexes to build.
+        """
+        await asyncio.gather(
+            self.run_step("openai", check_openai),
+            self.run_step("mongo", check_mongo),
+            self.run_step("node", check_node),
+            *(self.run_step(name, load_index, load, timeout=self.index_timeout) for name, load in (index_loads or {}).items()),
+        )
+        if snapshot_path and os.path.exists(snapshot_path):
+            snapshot = await asyncio.to_thread(load_snapshot, snapshot_path)
+            await asyncio.gather(
+                self.run_step("embedding_cache", preload_embeddings, snapshot),
+                self.run_step("product_cache", preload_products, snapshot, self.product_concurrency),
+            )
+        self.finished = time.time()
+        self.logger.info(f"Warmup finished in {(self.finished - self.started) * 1000:.0f} ms, ready={self.ready}")
+
+    def report(self) -> dict:
+        return {
+            "ready": self.ready,
+            "started": self.started,
+            "finished": self.finished,
+            "startup_ms": round((self.finished - self.started) * 1000, 1) if self.finished else None,
+            "steps": self.steps,
+        }
+
+async def check_openai():
+    import utils
+    try:
+        await utils.get_async_openai_client().models.list()
+    except APIStatusError:
+        # Any HTTP answer means DNS, TLS and the pooled connection are set up.
+        pass
+
+async def check_mongo():
+    import utils
+    await asyncio.to_thread(utils.get_mongo_client().admin.command, "ping")
+
+async def check_node():
+    from httpClient import node_request
+    await node_request("GET", os.getenv("WARMUP_NODE_PATH", "/"))
+
+async def load_index(load):
+    import utils
+    await asyncio.to_thread(load, utils.get_products_collection())
+
+async def preload_embeddings(snapshot: dict):
+    import utils
+    utils.embedding_cache.preload(snapshot["embeddings"])
+
+async def preload_products(snapshot: dict, concurrency: int = 16):
+    from searchTools import lookup_products
+    product_ids = [int(product_id) if product_id.isdigit() else product_id for product_id in snapshot["product_ids"]]
+    # Bounded, so a large snapshot does not open hundreds of Node requests at once.
+    semaphore = asyncio.Semaphore(concurrency)
+    async def lookup(product_id):
+        async with semaphore: await lookup_products([product_id])
+    await asyncio.gather(*(lookup(product_id) for product_id in product_ids))
+
+def save_snapshot(path: str, embeddings: int = 1000, products: int = 500):
+    """
+    Write the most recently used embedding cache entries and product ids for the next startup.
+    """
+    import utils
+    from productCache import product_cache
+    entries = utils.embedding_cache.snapshot(embeddings)
+    product_ids = [key for endpoint, key in reversed(product_cache.entries) if endpoint == "id"][:products]
+    vectors = [np.asarray(vector, dtype=np.float32) for _, vector in entries]
+    with open(path, "wb") as f:
+        np.savez(
+            f,
+            keys=np.asarray([key for key, _ in entries], dtype=str),
+            lengths=np.asarray([len(vector) for vector in vectors], dtype=np.int64),
+            vectors=np.concatenate(vectors) if vectors else np.zeros(0, dtype=np.float32),
+            product_ids=np.asarray(product_ids, dtype=str),
+        )
+
+def load_snapshot(path: str) -> dict:
+    data = np.load(path)
+    offsets = np.concatenate([[0], np.cumsum(data["lengths"])])
+    vectors = data["vectors"]
+    embeddings = [(str(key), vectors[offsets[i]:offsets[i + 1]].tolist()) for i, key in enumerate(data["keys"])]
+    return {"embeddings": embeddings, "product_ids": [str(product_id) for product_id in data["product_ids"]]}
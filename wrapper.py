@@ -1,34 +1,103 @@
 from agents import Agent, RunContextWrapper, Runner, function_tool, set_default_openai_key
-from searchTools import search_by_category, search_by_id, fuzzy_search
-from ragAgent import vector_store_retriever_agent
+from searchTools import search_by_category, search_by_id, search_by_ids, fuzzy_search
+from ragAgent import get_retrieval_tool, get_retrieval_mode, RETRIEVAL_MODES
 from utils import get_user_info
 import pydantic
+import logging
 import utils
-from cartAgent import get_user_agent
+import re
+import os
+import time
+from types import MappingProxyType
+from responseCache import response_cache, normalize_query
+from cartAgent import cart_manager
 
-async def get_agent_response(user_name, user_age, user_input, last_response_id=None, user_jwt=None, use_structuring=False):
-    set_default_openai_key(utils.get_key())
-    user = utils.User(name=user_name, 
-                      age=user_age, 
-                      last_response_id=last_response_id, 
-                      user_jwt=user_jwt
-                    )
-    print(f"User Info: {user.name}, Age: {user.age}, JWT: {user.user_jwt}, Last Response ID: {user.last_response_id}")
+logger = logging.getLogger("fastapi_logger")
+
+PRODUCT_ID_TAG = re.compile(r"<id>\s*(\d+)\s*</id>")
+
+def extract_product_ids(text: str) -> list:
+    return list(dict.fromkeys(int(product_id) for product_id in PRODUCT_ID_TAG.findall(text or "")))
 
-    cart_manager = get_user_agent()
+def get_main_tools(retrieval_mode: str) -> list:
+    # hybrid_search covers both keyword and semantic search, so the fuzzy search round trip is dropped.
+    if retrieval_mode == "hybrid": return [search_by_category, search_by_id, search_by_ids, get_retrieval_tool(retrieval_mode)]
+    return [search_by_category, search_by_id, search_by_ids, fuzzy_search, get_retrieval_tool(retrieval_mode)]
+
+def build_main_agent(use_structuring=False, retrieval_mode="agent"):
     inst =  """
                 You are a shopping assistant for wallmart. You help users with all there needs with all the capabilities you have. 
                 You are helpful assistant as well as a good salesman and you are to sell the products offered by the company that you can access
                 through all the tools at your disposal. If the response has products you must include there product ids.
             """
     if not use_structuring: inst += "and you have to insert the product ids (int) in an xml tag <id></id>."
+    else: inst += "Write every product id as ID: <number>, e.g. (ID: 123)."
 
     agent = Agent[utils.User](name="Shopping Assistant",
                             instructions=inst,
                             model="gpt-4.1",
-                            tools=[search_by_category,search_by_id,fuzzy_search,vector_store_retriever_agent],
+                            tools=get_main_tools(retrieval_mode),
                             handoffs=[cart_manager]
                             )
+    return agent
+
+# Prebuilt at import and shared by all requests, keyed on (use_structuring, retrieval_mode). Agents must
+# not be mutated per request; per-request data travels only through the utils.User context.
+MAIN_AGENTS = MappingProxyType({
+    (use_structuring, retrieval_mode): build_main_agent(use_structuring=use_structuring, retrieval_mode=retrieval_mode)
+    for use_structuring in (False, True)
+    for retrieval_mode in RETRIEVAL_MODES
+})
+
+def get_main_agent(use_structuring=False, retrieval_mode=None):
+    return MAIN_AGENTS[(bool(use_structuring), retrieval_mode or get_retrieval_mode())]
+
+def use_semantic_cache(last_response_id=None, user_jwt=None) -> bool:
+    # Only stateless, anonymous first turns are shared; carts and conversations are per user.
+    return os.getenv("SEMANTIC_CACHE_ENABLED", "1") == "1" and not last_response_id and not user_jwt
+
+async def get_agent_response(user_name, user_age, user_input, last_response_id=None, user_jwt=None, use_structuring=False):
+    if not use_semantic_cache(last_response_id, user_jwt):
+        if os.getenv("SEMANTIC_CACHE_ENABLED", "1") == "1": response_cache.bypass()
+        return await run_agent(user_name, user_age, user_input, last_response_id, user_jwt, use_structuring)
+
+    # The cache is an optimisation: embedding or cache errors fall through to a normal agent run.
+    variant = (bool(use_structuring), get_retrieval_mode())
+    query_embedding = None
+    try:
+        query_embedding = await utils.aget_embedding(normalize_query(user_input))
+        cached = response_cache.lookup(query_embedding, variant)
+    except Exception as e:
+        response_cache.errors += 1
+        logger.warning(f"Semantic cache lookup failed: {e}")
+        cached = None
+    if cached is not None:
+        response, similarity = cached
+        logger.info(f"Semantic cache hit ({similarity:.3f}) for: {user_input}")
+        # The cached run's response id belongs to another user's conversation, so a hit starts none.
+        return {**response, "new_message_id": None, "user_input": user_input}
+
+    start = time.perf_counter()
+    response = await run_agent(user_name, user_age, user_input, last_response_id, user_jwt, use_structuring)
+    if query_embedding is not None:
+        try:
+            # Store a copy without the per-request fields; the caller goes on to modify the response it gets back.
+            cached = {key: value for key, value in response.items() if key not in ("new_message_id", "user_input")}
+            response_cache.store(query_embedding, variant, cached, (time.perf_counter() - start) * 1000)
+        except Exception as e:
+            response_cache.errors += 1
+            logger.warning(f"Semantic cache store failed: {e}")
+    return response
+
+async def run_agent(user_name, user_age, user_input, last_response_id=None, user_jwt=None, use_structuring=False):
+    user = utils.User(name=user_name, 
+                      age=user_age, 
+                      last_response_id=last_response_id, 
+                      user_jwt=user_jwt
+                    )
+    print(f"User Info: {user.name}, Age: {user.age}, JWT: {user.user_jwt}, Last Response ID: {user.last_response_id}")
+
+    agent = get_main_agent(use_structuring)
     
     try:
         result = await Runner.run(agent, user_input, previous_response_id=last_response_id, context=user)
@@ -38,7 +107,7 @@ async def get_agent_response(user_name, user_age, user_input, last_response_id=N
 
     try:
         if use_structuring:
-            final_output = utils.final_product_structured(final_output)
+            final_output = await utils.structure_product_ids(final_output, user.product_ids)
     except Exception as e:
         raise ValueError(f"Error in structuring final output: {e}")
     new_message_id = result.last_response_id
@@ -47,4 +116,60 @@ async def get_agent_response(user_name, user_age, user_input, last_response_id=N
             "new_message_id": new_message_id, 
             "user_input": user_input,
             "final_output": final_output
-            }
\ No newline at end of file
+            }
+
+def raw_item_field(item, field):
+    raw_item = getattr(item, "raw_item", None)
+    if isinstance(raw_item, dict): return raw_item.get(field)
+    return getattr(raw_item, field, None)
+
+async def stream_agent_response(user_name, user_age, user_input, last_response_id=None, user_jwt=None, use_structuring=False):
+    """
+    Run the main agent with Runner.run_streamed and yield (event, data) pairs:
+    "token" deltas, "tool_start"/"tool_end", "handoff" and "agent", then one "final" event
+    carrying new_message_id, the final output and the product ids found in it.
+    """
+    user = utils.User(name=user_name, 
+                      age=user_age, 
+                      last_response_id=last_response_id, 
+                      user_jwt=user_jwt
+                    )
+    print(f"User Info: {user.name}, Age: {user.age}, JWT: {user.user_jwt}, Last Response ID: {user.last_response_id}")
+
+    agent = get_main_agent(use_structuring)
+    result = Runner.run_streamed(agent, user_input, previous_response_id=last_response_id, context=user)
+    tool_names = {}
+
+    async for event in result.stream_events():
+        if event.type == "raw_response_event":
+            if getattr(event.data, "type", None) == "response.output_text.delta":
+                yield "token", {"delta": event.data.delta}
+        elif event.type == "agent_updated_stream_event":
+            yield "agent", {"name": event.new_agent.name}
+        elif event.type == "run_item_stream_event":
+            if event.name == "tool_called":
+                call_id = raw_item_field(event.item, "call_id")
+                tool_names[call_id] = raw_item_field(event.item, "name")
+                yield "tool_start", {"call_id": call_id, "name": tool_names[call_id]}
+            elif event.name == "tool_output":
+                call_id = raw_item_field(event.item, "call_id")
+                yield "tool_end", {"call_id": call_id, "name": tool_names.get(call_id)}
+            elif event.name == "handoff_occured":
+                yield "handoff", {
+                    "from": getattr(getattr(event.item, "source_agent", None), "name", None),
+                    "to": getattr(getattr(event.item, "target_agent", None), "name", None),
+                }
+
+    final_output = result.final_output
+    try:
+        if use_structuring:
+            final_output = await utils.structure_product_ids(final_output, user.product_ids)
+    except Exception as e:
+        raise ValueError(f"Error in structuring final output: {e}")
+
+    yield "final", {
+        "new_message_id": result.last_response_id,
+        "user_input": user_input,
+        "final_output": final_output,
+        "product_ids": extract_product_ids(final_output),
+    }